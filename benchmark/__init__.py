@@ -0,0 +1,3 @@
+"""
+Offline replay harness and throughput benchmark for the news crawlers.
+"""
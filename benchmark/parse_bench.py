@@ -0,0 +1,81 @@
+"""
+Compare listing page extraction paths on recorded listing pages:
+    python -m benchmark.parse_bench vnexpress --fixtures fixtures/vnexpress [-n 200]
+
+"css" is the spiders' Scrapy CSS selectors, "xpath" the precompiled XPath of
+news_crawler.helper.listing_parser. Both run on an already parsed page, since parsing
+the HTML costs the same either way.
+"""
+import json
+from base64 import b64decode
+from dataclasses import asdict
+from argparse import ArgumentParser
+from time import perf_counter
+
+from scrapy.http import HtmlResponse
+
+from news_crawler.spiders.vnexpress import VnExpressSpider
+from news_crawler.spiders.tuoitre import TuoiTreSpider
+from .replay import FixtureStore
+
+spiders = {
+    "vnexpress": VnExpressSpider,
+    "tuoitre": TuoiTreSpider
+}
+
+
+def load_listing_pages(store: FixtureStore, spider):
+    """
+    Responses of the spider's own domain, i.e. listing pages, excluding comment APIs.
+    """
+    pages = []
+    for host in spider.allowed_domains:
+        for fixture in store.iter_fixtures(host):
+            if fixture["status"] != 200:
+                continue
+            # Recorded URLs end with "?" when there was no query.
+            response = HtmlResponse(fixture["url"].rstrip("?"), body=b64decode(fixture["body"]), encoding="utf-8")
+            # Parse now so it isn't counted against whichever path runs first.
+            response.selector
+            pages.append(response)
+    return pages
+
+
+def time_path(extract, pages, iterations):
+    start = perf_counter()
+    for _ in range(iterations):
+        for page in pages:
+            extract(page)
+    return perf_counter() - start
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark.parse_bench", description="Benchmark listing page extraction.")
+    parser.add_argument("SPIDER", choices=spiders.keys())
+    parser.add_argument("--fixtures", required=True, help="Fixture directory recorded by benchmark.run.")
+    parser.add_argument("-n", "--iterations", type=int, default=100, help="Passes over every page.")
+    args = parser.parse_args()
+
+    spider = spiders[args.SPIDER]()
+    pages = load_listing_pages(FixtureStore(args.fixtures), spider)
+    if not pages:
+        raise SystemExit(f"No listing pages of {args.SPIDER} in {args.fixtures}")
+
+    paths = {"css": spider.get_article_list_css, "xpath": spider.get_article_list}
+    # Both paths must extract the same articles for the comparison to mean anything.
+    for page in pages:
+        expected, actual = ([asdict(article) for article in extract(page)] for extract in paths.values())
+        if expected != actual:
+            raise SystemExit(f"Extraction paths disagree on {page.url}")
+
+    articles = sum(len(spider.get_article_list(page)) for page in pages)
+    report = {"pages": len(pages), "articles": articles, "iterations": args.iterations}
+    for name, extract in paths.items():
+        elapsed = time_path(extract, pages, args.iterations)
+        report[f"{name}_ms_per_page"] = elapsed * 1000 / (len(pages) * args.iterations)
+    report["speedup"] = report["css_ms_per_page"] / report["xpath_ms_per_page"]
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
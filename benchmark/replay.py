@@ -0,0 +1,152 @@
+"""
+Local HTTP stand-in for vnexpress.net, tuoitre.vn and their comment APIs.
+
+Requests arrive as http://HOST:PORT/<live host>/<path>?<query> (see news_crawler.middlewares).
+In record mode, unknown requests are forwarded to the live site and the response is saved
+into the fixture directory. In replay mode, only recorded responses are served.
+"""
+import json
+import asyncio
+import hashlib
+import threading
+from base64 import b64decode, b64encode
+from logging import getLogger
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode
+
+from aiohttp import ClientSession, web
+
+logger = getLogger(__name__)
+
+# Headers worth replaying. Everything else (length, encoding, cookies) is recomputed or dropped.
+KEPT_HEADERS = ("Content-Type", "ETag", "Last-Modified", "Cache-Control")
+
+
+class FixtureStore:
+    """
+    Recorded responses on disk, one JSON file per request:
+    <fixture dir>/<live host>/<sha1 of method, path and sorted query>.json
+    """
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+
+    @staticmethod
+    def key(method, path, query):
+        normalized = urlencode(sorted(parse_qsl(query, keep_blank_values=True)))
+        return hashlib.sha1(f"{method} {path}?{normalized}".encode()).hexdigest()
+
+    def path(self, host, method, path, query):
+        return self.directory / host / f"{self.key(method, path, query)}.json"
+
+    def load(self, host, method, path, query):
+        fixture = self.path(host, method, path, query)
+        if not fixture.exists():
+            return None
+        with open(fixture) as f:
+            return json.load(f)
+
+    def save(self, host, method, path, query, status, headers, body):
+        fixture = self.path(host, method, path, query)
+        fixture.parent.mkdir(parents=True, exist_ok=True)
+        with open(fixture, "w") as f:
+            json.dump({
+                "url": f"https://{host}{path}?{query}",
+                "status": status,
+                "headers": headers,
+                "body": b64encode(body).decode()
+            }, f)
+
+    def iter_fixtures(self, host):
+        """
+        Yield every recorded response of host.
+        """
+        for fixture in sorted((self.directory / host).glob("*.json")):
+            with open(fixture) as f:
+                yield json.load(f)
+
+    def read_manifest(self):
+        manifest = self.directory / "manifest.json"
+        if not manifest.exists():
+            return {}
+        with open(manifest) as f:
+            return json.load(f)
+
+    def write_manifest(self, manifest):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / "manifest.json", "w") as f:
+            json.dump(manifest, f, indent=2)
+
+
+class ReplayServer:
+    """
+    aiohttp server serving a FixtureStore, running on its own thread so it doesn't
+    share a core's event loop with whatever is being benchmarked.
+    """
+
+    def __init__(self, store: FixtureStore, host="127.0.0.1", port=8765, record=False):
+        self.store = store
+        self.host = host
+        self.port = port
+        self.record = record
+        self.hits = 0
+        self.misses = 0
+        self._loop = None
+        self._client = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    async def handle(self, request):
+        live_host, _, path = request.match_info["target"].partition("/")
+        path = "/" + path
+        query = request.query_string
+        fixture = self.store.load(live_host, request.method, path, query)
+        if fixture is None and self.record:
+            fixture = await self.fetch_live(live_host, request.method, path, query)
+        if fixture is None:
+            self.misses += 1
+            logger.warning("No fixture for %s %s%s?%s", request.method, live_host, path, query)
+            return web.Response(status=404)
+        self.hits += 1
+        return web.Response(
+            status=fixture["status"],
+            headers=fixture["headers"],
+            body=b64decode(fixture["body"])
+        )
+
+    async def fetch_live(self, live_host, method, path, query):
+        url = f"https://{live_host}{path}" + (f"?{query}" if query else "")
+        async with self._client.request(method, url) as response:
+            body = await response.read()
+            headers = {k: v for k, v in response.headers.items() if k in KEPT_HEADERS}
+            self.store.save(live_host, method, path, query, response.status, headers, body)
+            logger.info("Recorded <%d %s>", response.status, url)
+        return self.store.load(live_host, method, path, query)
+
+    async def _serve(self):
+        self._client = ClientSession()
+        app = web.Application()
+        app.router.add_route("*", "/{target:.+}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def _shutdown(self):
+        await self._runner.cleanup()
+        await self._client.close()
+
+    def start(self):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, daemon=True)
+        self._thread.start()
+        asyncio.run_coroutine_threadsafe(self._serve(), self._loop).result()
+        logger.info("Replay server listening on %s (record=%s)", self.url, self.record)
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
@@ -0,0 +1,103 @@
+"""
+Drive a full `scrapy crawl` against recorded fixtures and report throughput.
+
+Record fixtures once from the live sites:
+    python -m benchmark.run vnexpress --fixtures fixtures/vnexpress --record -a days_ago=2
+Replay them (offline) as often as needed:
+    python -m benchmark.run vnexpress --fixtures fixtures/vnexpress
+"""
+import sys
+import json
+import logging
+import subprocess
+from os import environ
+from time import time
+from pathlib import Path
+from argparse import ArgumentParser
+from tempfile import TemporaryDirectory
+
+from .replay import FixtureStore, ReplayServer
+
+logger = logging.getLogger(__name__)
+
+
+def run_crawl(spider, replay_url, report_path, db_uri, spider_args, extra_settings):
+    """
+    Run scrapy crawl in a subprocess so its reactor, memory and CPU usage are isolated.
+    """
+    command = [
+        sys.executable, "-m", "scrapy", "crawl", spider,
+        "-s", f"REPLAY_URL={replay_url}",
+        "-s", f"BENCHMARK_REPORT={report_path}",
+        # The replay server doesn't serve robots.txt.
+        "-s", "ROBOTSTXT_OBEY=False",
+        "-s", "LOG_LEVEL=INFO",
+    ]
+    for key, value in spider_args.items():
+        command += ["-a", f"{key}={value}"]
+    for setting in extra_settings:
+        command += ["-s", setting]
+    env = {
+        **environ,
+        "POSTGRES_URI": db_uri,
+        # Start every run with a cold score cache next to the report.
+        "SCORER_CACHE_PATH": str(Path(report_path).parent / "score_cache.sqlite"),
+        # Crawl the recorded categories instead of discovering them.
+        "CATEGORY_INDEX_PATH": "",
+        # One comment count request per listing page, as recorded, unless set.
+        "COMMENT_COUNT_BATCH_SIZE": environ.get("COMMENT_COUNT_BATCH_SIZE", "0"),
+    }
+    logger.info("Running: %s", " ".join(command))
+    subprocess.run(command, env=env, check=True)
+
+
+def main():
+    parser = ArgumentParser(prog="benchmark", description="Replay benchmark for news crawlers.")
+    parser.add_argument("SPIDER", help="Spider to benchmark (vnexpress|tuoitre)")
+    parser.add_argument("--fixtures", required=True, help="Fixture directory to replay from or record into.")
+    parser.add_argument("--record", action="store_true", help="Forward unknown requests to live sites and save them.")
+    parser.add_argument("--port", type=int, default=8765, help="Port of the replay server.")
+    parser.add_argument(
+        "--db-uri", default=None,
+        help="Database to write into. Default to a throwaway SQLite database (requires aiosqlite)."
+    )
+    parser.add_argument("-a", dest="spider_args", action="append", default=[], help="Spider argument NAME=VALUE.")
+    parser.add_argument("-s", dest="settings", action="append", default=[], help="Scrapy setting NAME=VALUE.")
+    parser.add_argument("-o", "--output", default=None, help="Also save the JSON report to this file.")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s [%(name)s] %(levelname)s: %(message)s")
+
+    store = FixtureStore(args.fixtures)
+    spider_args = dict(arg.split("=", 1) for arg in args.spider_args)
+    manifest = store.read_manifest()
+    if args.record:
+        # Pin the crawl window so replayed runs issue exactly the recorded requests.
+        spider_args.setdefault("to_timestamp", str(int(time())))
+        store.write_manifest({"spider": args.SPIDER, "spider_args": spider_args})
+    else:
+        if not manifest:
+            parser.error(f"No manifest.json in {args.fixtures}. Record fixtures first with --record.")
+        spider_args = {**manifest["spider_args"], **spider_args}
+
+    server = ReplayServer(store, port=args.port, record=args.record)
+    server.start()
+    try:
+        with TemporaryDirectory() as tmp_dir:
+            db_uri = args.db_uri or f"sqlite+aiosqlite:///{Path(tmp_dir) / 'benchmark.db'}"
+            report_path = Path(tmp_dir) / "report.json"
+            run_crawl(args.SPIDER, server.url, report_path, db_uri, spider_args, args.settings)
+            with open(report_path) as f:
+                report = json.load(f)
+    finally:
+        server.stop()
+
+    report["fixture_hits"] = server.hits
+    report["fixture_misses"] = server.misses
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Collect throughput and latency numbers of a crawl and dump them to a JSON report.
+"""
+import json
+import resource
+from logging import getLogger
+from time import perf_counter
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers. 0 for empty list."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, min(len(ordered) - 1, round(pct / 100 * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class BenchmarkStats:
+    """
+    Spider middleware stamping every item when the spider yields it, so the time it
+    spends in the item pipelines (scorer, postgres) can be measured at item_scraped.
+    Enabled by setting BENCHMARK_REPORT to the output path.
+    """
+
+    def __init__(self, crawler, report_path):
+        self.crawler = crawler
+        self.report_path = report_path
+        self.started = None
+        self.response_count = 0
+        self.item_count = 0
+        self.latencies = []
+        # {id(item): time yielded by spider}
+        self._yielded_at = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        report_path = crawler.settings.get("BENCHMARK_REPORT")
+        if not report_path:
+            raise NotConfigured
+        ext = cls(crawler, report_path)
+        crawler.signals.connect(ext.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(ext.spider_closed, signal=signals.spider_closed)
+        crawler.signals.connect(ext.response_received, signal=signals.response_received)
+        crawler.signals.connect(ext.item_done, signal=signals.item_scraped)
+        crawler.signals.connect(ext.item_done, signal=signals.item_dropped)
+        return ext
+
+    def process_spider_output(self, response, result, spider):
+        for request_or_item in result:
+            if not hasattr(request_or_item, "callback"):
+                self._yielded_at[id(request_or_item)] = perf_counter()
+            yield request_or_item
+
+    async def process_spider_output_async(self, response, result, spider):
+        async for request_or_item in result:
+            if not hasattr(request_or_item, "callback"):
+                self._yielded_at[id(request_or_item)] = perf_counter()
+            yield request_or_item
+
+    def spider_opened(self, spider):
+        self.started = perf_counter()
+
+    def response_received(self, response, request, spider):
+        self.response_count += 1
+
+    def item_done(self, item, spider, **kwargs):
+        self.item_count += 1
+        yielded_at = self._yielded_at.pop(id(item), None)
+        if yielded_at is not None:
+            self.latencies.append(perf_counter() - yielded_at)
+
+    def spider_closed(self, spider, reason):
+        elapsed = perf_counter() - self.started
+        scorer_requests = self.crawler.stats.get_value("scorer/request_count", 0)
+        report = {
+            "spider": spider.name,
+            "finish_reason": reason,
+            "elapsed_sec": elapsed,
+            "items": self.item_count,
+            "scrapy_requests": self.response_count,
+            "scorer_requests": scorer_requests,
+            "scorer_requests_per_article": scorer_requests / max(1, self.crawler.stats.get_value("scorer/articles_scored", 0)),
+            "items_per_sec": self.item_count / elapsed,
+            "requests_per_sec": (self.response_count + scorer_requests) / elapsed,
+            "item_latency_p50_ms": percentile(self.latencies, 50) * 1000,
+            "item_latency_p99_ms": percentile(self.latencies, 99) * 1000,
+            # Linux reports kilobytes.
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        with open(self.report_path, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info("Benchmark report written to %s", self.report_path)
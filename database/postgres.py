@@ -1,14 +1,63 @@
+import asyncio
 from logging import getLogger
+from random import random
+from uuid import uuid4
 
+from sqlalchemy import inspect, make_url, text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.schema import CreateColumn
+from sqlalchemy.pool import NullPool
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 
 logger = getLogger(f"scrapy.{__name__}")
 
 
+def setting_enabled(value) -> bool:
+    """
+    Boolean setting, also when given as a string such as "0" or "False" (e.g. with scrapy -s).
+    """
+    return str(value).lower() not in ("", "0", "false", "none")
+
+
+def add_missing_columns(conn, metadata):
+    """
+    Add columns introduced after a table was created (e.g. needs_rescore, identifier) to
+    tables of an older schema. Only nullable columns and those with a server default can be
+    added to tables with rows.
+    """
+    inspector = inspect(conn)
+    # Nodes starting together may add the same column.
+    if_not_exists = "IF NOT EXISTS " if conn.dialect.name == "postgresql" else ""
+    for table in metadata.sorted_tables:
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            definition = CreateColumn(column).compile(dialect=conn.dialect)
+            conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {if_not_exists}{definition}"))
+            logger.warning("Added missing column %s.%s", table.name, column.name)
+
+
 class Postgres:
+    # {(uri, pool options): (Postgres, reference count)} of engines shared in this process.
+    _shared = {}
 
-    def __init__(self, uri=None, user=None, password=None, database=None, host="localhost", port=5432):
+    def __init__(
+        self, uri=None, user=None, password=None, database=None, host="localhost", port=5432,
+        pool_size=5, max_overflow=10, pool_pre_ping=False, pool_recycle=-1,
+        statement_cache_size=100, pgbouncer=False
+    ):
+        """
+        Args:
+            pool_size: Connections kept open in the pool.
+            max_overflow: Connections opened on top of pool_size under load, closed when returned.
+            pool_pre_ping: Test connections on checkout, replacing ones the server dropped.
+            pool_recycle: Seconds before a connection is replaced. -1 to keep forever.
+            statement_cache_size: Prepared statements cached per connection. 0 to disable.
+            pgbouncer: Work behind PgBouncer in transaction mode: no client side pool, no
+                cached prepared statements and unique statement names.
+        """
         if uri is not None:
             self.uri = uri
         else:
@@ -21,20 +70,94 @@ class Postgres:
                 port,
                 database
             )
-        self.engine = create_async_engine(self.uri)
-        logger.info("Postgres URI: %s", self.uri)
+        self._shared_key = None
+        engine_options = {}
+        # Pool options only apply to Postgres. SQLite stand-in keeps its dialect's pool.
+        if make_url(self.uri).get_backend_name() == "postgresql":
+            if pgbouncer:
+                engine_options["poolclass"] = NullPool
+                engine_options["connect_args"] = {
+                    "statement_cache_size": 0,
+                    "prepared_statement_cache_size": 0,
+                    "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4()}__",
+                }
+            else:
+                engine_options.update(
+                    pool_size=pool_size,
+                    max_overflow=max_overflow,
+                    pool_pre_ping=pool_pre_ping,
+                    pool_recycle=pool_recycle,
+                    connect_args={
+                        "statement_cache_size": statement_cache_size,
+                        "prepared_statement_cache_size": statement_cache_size,
+                    }
+                )
+        self.engine = create_async_engine(self.uri, **engine_options)
+        logger.info("Postgres URI: %s", self.engine.url)
+
+    @classmethod
+    def from_settings(cls, pg_settings: dict, uri=None):
+        """
+        Get the engine shared by every user of the same POSTGRES_PIPELINE_SETTINGS in this
+        process, creating it on first use. Release with close_db().
+        """
+        options = {
+            "pool_size": int(pg_settings.get("POOL_SIZE", 5)),
+            "max_overflow": int(pg_settings.get("MAX_OVERFLOW", 10)),
+            "pool_pre_ping": setting_enabled(pg_settings.get("POOL_PRE_PING", False)),
+            "pool_recycle": int(pg_settings.get("POOL_RECYCLE", -1)),
+            "statement_cache_size": int(pg_settings.get("STATEMENT_CACHE_SIZE", 100)),
+            "pgbouncer": setting_enabled(pg_settings.get("PGBOUNCER", False)),
+        }
+        uri = uri or pg_settings.get("URI")
+        key = (uri, tuple(sorted(options.items())))
+        postgres, references = cls._shared.get(key, (None, 0))
+        if postgres is None:
+            postgres = cls(uri=uri, **options)
+            postgres._shared_key = key
+        cls._shared[key] = (postgres, references + 1)
+        return postgres
+
+    def pool_status(self) -> dict:
+        """
+        Connections of the pool: open in pool, checked out, and opened over pool size.
+        """
+        pool = self.engine.pool
+        status = {}
+        for metric in ("size", "checkedin", "checkedout", "overflow"):
+            if hasattr(pool, metric):
+                status[metric] = getattr(pool, metric)()
+        return status
 
     async def close_db(self):
-        logger.debug("Postgres engine disposed.")
+        if self._shared_key is not None:
+            postgres, references = self._shared[self._shared_key]
+            if references > 1:
+                # Still used elsewhere.
+                self._shared[self._shared_key] = (postgres, references - 1)
+                return
+            del self._shared[self._shared_key]
+        logger.debug("Postgres engine disposed. Pool: %s", self.pool_status())
         await self.engine.dispose()
 
-    async def init_db(self, metadata):
+    async def init_db(self, metadata, retries=2):
         """
-        Create all database specified in metadata.
+        Create all database specified in metadata, and columns missing from existing tables.
 
         Args:
             metadata: Create tables specified in here.
+            retries: Attempts after failing, e.g. because another crawl node created a table
+                between checking for and creating it.
         """
-        async with self.engine.begin() as conn:
-            await conn.run_sync(metadata.create_all)
-            logger.debug("Created all tables: %s", metadata.tables.keys())
\ No newline at end of file
+        for attempt in range(retries + 1):
+            try:
+                async with self.engine.begin() as conn:
+                    await conn.run_sync(metadata.create_all)
+                    await conn.run_sync(add_missing_columns, metadata)
+                    logger.debug("Created all tables: %s", metadata.tables.keys())
+                return
+            except DBAPIError:
+                if attempt == retries:
+                    raise
+                logger.debug("Creating tables failed, retrying", exc_info=True)
+                await asyncio.sleep(random())
@@ -1,5 +1,5 @@
 import enum
-from sqlalchemy import Column, String, Integer, Enum, DateTime
+from sqlalchemy import Column, String, Integer, Enum, DateTime, Index, desc
 
 from .base import Base
 
@@ -15,10 +15,22 @@ class VnExpress(Base):
     article_type = Column(Integer, nullable=False)
     category_id = Column(String(10), nullable=False)
 
+    # Top N per category, and top N in a time window. Covering, so ranking reads skip the table.
+    __table_args__ = (
+        Index("ix_vnexpress_category_id_score", "category_id", desc("score"), postgresql_include=["url", "title"]),
+        Index("ix_vnexpress_create_time_score", "create_time", desc("score"), postgresql_include=["url", "title"]),
+    )
+
 class TuoiTre(Base):
     """
     Schema for saving article in to Postgres.
     """
     category = Column(String(256), nullable=False)
     item_type = Column(Enum(ItemType), nullable=False, default=ItemType.article)
-    published_time = Column(DateTime(timezone=True), nullable=False)
\ No newline at end of file
+    published_time = Column(DateTime(timezone=True), nullable=False)
+
+    # Top N per category, and top N in a time window. Covering, so ranking reads skip the table.
+    __table_args__ = (
+        Index("ix_tuoitre_published_time_score", "published_time", desc("score"), postgresql_include=["url", "title"]),
+        Index("ix_tuoitre_category_score", "category", desc("score"), postgresql_include=["url", "title"]),
+    )
\ No newline at end of file
@@ -1,4 +1,5 @@
-from sqlalchemy import Column, Identity, BigInteger, String, Integer, DateTime
+from sqlalchemy import Column, Identity, BigInteger, Boolean, String, Integer, DateTime
+from sqlalchemy.sql.expression import false
 from sqlalchemy.orm import registry, declared_attr
 from sqlalchemy.sql.functions import current_timestamp
 
@@ -10,10 +11,21 @@ class Base(object):
     def __tablename__(cls) -> str:
         return cls.__name__.lower()
 
-    id = Column(BigInteger, Identity(always=True), primary_key=True)
+    # SQLite only auto-increments INTEGER primary keys.
+    id = Column(BigInteger().with_variant(Integer, "sqlite"), Identity(always=True), primary_key=True)
     create_time = Column(DateTime(timezone=True), server_default=current_timestamp())
     update_time = Column(DateTime(timezone=True), server_default=current_timestamp(), onupdate=current_timestamp())
     url = Column(String(256), index=True, nullable=False, unique=True)
     title = Column(String(256), nullable=False)
     score = Column(Integer, index=True, nullable=False, default=0)
     comment_count = Column(Integer, nullable=False, default=0)
+    # Identifier used by the news site, needed to query its comment API when rescoring.
+    identifier = Column(String(64), nullable=True)
+    # When score was last calculated. Null if never.
+    score_time = Column(DateTime(timezone=True), nullable=True)
+    # Set when scoring failed. Score is left as is until a later run succeeds.
+    needs_rescore = Column(Boolean, nullable=False, default=False, server_default=false())
+    # Scoring worker (news_crawler.score) scoring the article and when it claimed it.
+    # Claims older than SCORING_WORKER_SETTINGS CLAIM_TIMEOUT are free for other workers.
+    claimed_by = Column(String(128), nullable=True)
+    claimed_at = Column(DateTime(timezone=True), nullable=True)
@@ -0,0 +1,32 @@
+from sqlalchemy import Table, Column, Identity, Index, UniqueConstraint, String, Integer, BigInteger, DateTime, LargeBinary, desc
+from sqlalchemy.sql.functions import current_timestamp
+
+from .base import Base
+
+# Requests shared by crawl nodes of a distributed crawl (news_crawler.scheduler).
+frontier = Table(
+    "frontier", Base.metadata,
+    Column("id", BigInteger().with_variant(Integer, "sqlite"), Identity(always=True), primary_key=True),
+    # Spider name and CRAWL_JOB. Nodes crawling together share one.
+    Column("job", String(128), nullable=False),
+    # Request fingerprint. Unique per job, so it's also the job's dupefilter.
+    Column("fingerprint", String(64), nullable=False),
+    Column("priority", Integer, nullable=False, default=0),
+    # request_to_dict as JSON (news_crawler.scheduler.dump_request). Emptied once done, the fingerprint is all that's needed then.
+    Column("request", LargeBinary, nullable=False),
+    # "pending", "claimed" or "done". "seen" for articles a node took (FrontierService.add_seen).
+    Column("state", String(16), nullable=False, default="pending"),
+    Column("claimed_by", String(128), nullable=True),
+    Column("claimed_at", DateTime(timezone=True), nullable=True),
+    Column("create_time", DateTime(timezone=True), server_default=current_timestamp()),
+    UniqueConstraint("job", "fingerprint"),
+    Index("ix_frontier_job_state_priority", "job", "state", desc("priority"), "id"),
+)
+
+# Crawl window of each distributed job, set by its first node so every node requests the same pages.
+frontier_job = Table(
+    "frontier_job", Base.metadata,
+    Column("job", String(128), primary_key=True),
+    Column("to_time", DateTime(timezone=True), nullable=False),
+    Column("create_time", DateTime(timezone=True), server_default=current_timestamp()),
+)
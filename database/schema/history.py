@@ -0,0 +1,14 @@
+from sqlalchemy import Table, Column, String, Integer, BigInteger, DateTime
+
+from .base import Base
+
+# Score of an article over time. A row is only added when comment count or score changed.
+score_history = Table(
+    "score_history", Base.metadata,
+    # Site table article_id refers to.
+    Column("site", String(32), primary_key=True),
+    Column("article_id", BigInteger().with_variant(Integer, "sqlite"), primary_key=True),
+    Column("observed_at", DateTime(timezone=True), primary_key=True),
+    Column("comment_count", Integer, nullable=False),
+    Column("score", Integer, nullable=False)
+)
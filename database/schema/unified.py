@@ -0,0 +1,25 @@
+from sqlalchemy import Table, Column, String, Integer, DateTime, Index, desc
+from sqlalchemy.sql.functions import current_timestamp
+
+from .base import Base
+
+# Articles of every site in one table, range partitioned by month of published_time.
+# Primary key includes published_time since Postgres requires the partition key in unique constraints.
+article = Table(
+    "article", Base.metadata,
+    Column("site", String(32), primary_key=True),
+    Column("url", String(256), primary_key=True),
+    # TuoiTre publish time. VnExpress has none, its first crawl time is used instead.
+    Column("published_time", DateTime(timezone=True), primary_key=True),
+    Column("title", String(256), nullable=False),
+    # TuoiTre category name, VnExpress category id.
+    Column("category", String(256), nullable=False),
+    Column("score", Integer, nullable=False, default=0),
+    Column("comment_count", Integer, nullable=False, default=0),
+    Column("identifier", String(64), nullable=True),
+    Column("create_time", DateTime(timezone=True), server_default=current_timestamp()),
+    Column("update_time", DateTime(timezone=True), server_default=current_timestamp(), onupdate=current_timestamp()),
+    Index("ix_article_published_time_score", "published_time", desc("score")),
+    Index("ix_article_category_score", "site", "category", desc("score")),
+    postgresql_partition_by="RANGE (published_time)"
+)
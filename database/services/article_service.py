@@ -6,9 +6,13 @@ from database.schema.article import VnExpress, TuoiTre
 
 class VnExpressDBService(BasePostgresService[VnExpress]):
     model = VnExpress
+    site = "vnexpress"
+    category_column = "category_id"
 
 class TuoiTreDbService(BasePostgresService[TuoiTre]):
     model = TuoiTre
+    site = "tuoitre"
+    published_column = "published_time"
 
 # Mapping spider name to DB service to use.
 crawler_db_mapping = {
@@ -0,0 +1,178 @@
+from hashlib import sha1
+from logging import getLogger
+from datetime import datetime, timezone
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.schema.frontier import frontier, frontier_job
+from .postgres_service import dialect_insert
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class FrontierService:
+    """
+    Request queue shared by the nodes of a distributed crawl.
+    Nodes claim pending requests with SELECT ... FOR UPDATE SKIP LOCKED, so each is handed
+    to one node. SQLite ignores the lock, which is fine for a single node stand-in.
+    """
+    table = frontier
+
+    @classmethod
+    async def pin_window(cls, db: AsyncSession, job: str, to_datetime: datetime) -> datetime:
+        """
+        Set the job's crawl window end to to_datetime unless a node already did, and commit.
+
+        Return:
+            The job's crawl window end, shared by all its nodes.
+        """
+        stmt = (
+            dialect_insert[db.dialect.name](frontier_job)
+            .values(job=job, to_time=to_datetime)
+            .on_conflict_do_nothing(index_elements=["job"])
+        )
+        await db.execute(stmt)
+        to_time = (await db.execute(select(frontier_job.c.to_time).where(frontier_job.c.job == job))).scalar_one()
+        await db.commit()
+        if to_time.tzinfo is None:
+            # SQLite returns naive datetimes
+            to_time = to_time.replace(tzinfo=timezone.utc)
+        return to_time
+
+    @classmethod
+    async def push(cls, db: AsyncSession, job: str, requests: list[dict]) -> int:
+        """
+        Add requests not seen by the job before and commit.
+
+        Args:
+            requests: [{"fingerprint": str, "priority": int, "request": bytes}]
+
+        Return:
+            Number of requests added. The rest were duplicates.
+        """
+        if not requests:
+            return 0
+        stmt = (
+            dialect_insert[db.dialect.name](frontier)
+            .values([{**request, "job": job, "state": "pending"} for request in requests])
+            .on_conflict_do_nothing(index_elements=["job", "fingerprint"])
+        )
+        result = await db.execute(stmt)
+        await db.commit()
+        return result.rowcount
+
+    @classmethod
+    async def add_seen(cls, db: AsyncSession, job: str, worker: str, keys: list[str]) -> set[str]:
+        """
+        Mark articles taken by worker and commit, so other nodes of the job skip them.
+
+        Return:
+            Keys no node took before.
+        """
+        if not keys:
+            return set()
+        # Hashed like request fingerprints, under a prefix so they never collide with one.
+        fingerprints = {sha1(f"article:{key}".encode()).hexdigest(): key for key in keys}
+        stmt = (
+            dialect_insert[db.dialect.name](frontier)
+            .values([
+                {"job": job, "fingerprint": fingerprint, "request": b"", "state": "seen", "claimed_by": worker}
+                for fingerprint in fingerprints
+            ])
+            .on_conflict_do_nothing(index_elements=["job", "fingerprint"])
+            .returning(frontier.c.fingerprint)
+        )
+        added = (await db.execute(stmt)).scalars().all()
+        await db.commit()
+        return {fingerprints[fingerprint] for fingerprint in added}
+
+    @classmethod
+    async def claim(cls, db: AsyncSession, job: str, worker: str, limit: int) -> list:
+        """
+        Mark up to limit pending requests claimed by worker and commit.
+
+        Return:
+            [(id, request)], highest priority first.
+        """
+        claimable = (
+            select(frontier.c.id)
+            .where(frontier.c.job == job, frontier.c.state == "pending")
+            .order_by(frontier.c.priority.desc(), frontier.c.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(frontier)
+            .where(frontier.c.id.in_(claimable.scalar_subquery()))
+            .values(state="claimed", claimed_by=worker, claimed_at=datetime.now(timezone.utc))
+            .returning(frontier.c.id, frontier.c.priority, frontier.c.request)
+        )
+        rows = (await db.execute(stmt)).all()
+        await db.commit()
+        # RETURNING doesn't keep the subquery's order.
+        rows.sort(key=lambda row: (-row.priority, row.id))
+        return [(row.id, row.request) for row in rows]
+
+    @classmethod
+    async def mark_done(cls, db: AsyncSession, ids: list[int]):
+        if not ids:
+            return
+        await db.execute(
+            update(frontier)
+            .where(frontier.c.id.in_(ids))
+            .values(state="done", request=b"")
+        )
+        await db.commit()
+
+    @classmethod
+    async def release(cls, db: AsyncSession, ids: list[int]):
+        """
+        Give claimed requests back to other nodes, e.g. those still buffered by a stopping node.
+        """
+        if not ids:
+            return
+        await db.execute(
+            update(frontier)
+            .where(frontier.c.id.in_(ids), frontier.c.state == "claimed")
+            .values(state="pending", claimed_by=None, claimed_at=None)
+        )
+        await db.commit()
+
+    @classmethod
+    async def requeue_stale(cls, db: AsyncSession, job: str, claimed_before: datetime) -> int:
+        """
+        Give back requests claimed before claimed_before, left by nodes that died. Return their number.
+        Articles those nodes took are forgotten too, as the requeued pages may be all that lists them.
+        """
+        stale = (frontier.c.job == job, frontier.c.state == "claimed", frontier.c.claimed_at < claimed_before)
+        workers = (await db.execute(select(frontier.c.claimed_by).where(*stale).distinct())).scalars().all()
+        if workers:
+            await db.execute(
+                frontier.delete()
+                .where(frontier.c.job == job, frontier.c.state == "seen", frontier.c.claimed_by.in_(workers))
+            )
+        result = await db.execute(
+            update(frontier)
+            .where(*stale)
+            .values(state="pending", claimed_by=None, claimed_at=None)
+        )
+        await db.commit()
+        return result.rowcount
+
+    @classmethod
+    async def count_unfinished(cls, db: AsyncSession, job: str) -> int:
+        """
+        Pending and claimed requests. The job is finished when there are none.
+        """
+        query = select(func.count()).where(frontier.c.job == job, frontier.c.state.in_(("pending", "claimed")))
+        return (await db.execute(query)).scalar_one()
+
+    @classmethod
+    async def clear(cls, db: AsyncSession, job: str) -> int:
+        """
+        Delete a job's requests and crawl window, so its name can be crawled again from the start.
+        """
+        result = await db.execute(frontier.delete().where(frontier.c.job == job))
+        await db.execute(frontier_job.delete().where(frontier_job.c.job == job))
+        await db.commit()
+        return result.rowcount
@@ -1,15 +1,34 @@
 from logging import getLogger
-from typing import Generic, Optional, Type, TypeVar
-from sqlalchemy import select
-from sqlalchemy.dialects.postgresql import insert
+from typing import AsyncIterator, Generic, Optional, Type, TypeVar
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import and_, bindparam, case, column, delete, func, literal_column, not_, or_, select, table, text, update
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.sql.functions import current_timestamp
 
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from database.schema.base import Base
+from database.schema.history import score_history
 
 TableType = TypeVar("TableType", bound=Base)
 
+# ON CONFLICT capable insert per dialect. SQLite is only used as a local stand-in for benchmarks.
+dialect_insert = {
+    "postgresql": postgresql.insert,
+    "sqlite": sqlite.insert
+}
+
+# Windows of the ranking materialized views.
+RANKING_WINDOWS = {
+    "24h": timedelta(hours=24),
+    "7d": timedelta(days=7)
+}
+# Articles kept per category in each ranking view.
+RANKING_DEPTH = 100
+
+# Postgres wire protocol allows at most 32767 bind parameters per statement.
+MAX_BIND_PARAMS = 32767
+
 logger = getLogger(f"scrapy.{__name__}")
 
 class BasePostgresService(Generic[TableType]):
@@ -17,6 +36,21 @@ class BasePostgresService(Generic[TableType]):
     Base Postgres service.
     """
     model: Type[TableType]
+    # Site name, recorded in score_history.
+    site: str
+    # Add a score_history row whenever an upsert or rescoring changes comment count or score.
+    record_history = True
+    # How bulk_upsert sends rows:
+    #   "values": multi-row INSERT ... VALUES ... ON CONFLICT, chunked by bind parameter limit.
+    #   "copy": binary COPY into a staging table, then one INSERT ... SELECT ... ON CONFLICT.
+    #           Much faster for large buffers. Falls back to "values" outside Postgres.
+    #   "executemany": one single-row statement run for every row. Its SQL never changes, so
+    #           the prepared statement is cached and reused across flushes.
+    upsert_method = "values"
+    # Column telling when an article was published, used to filter exports by date.
+    published_column = "create_time"
+    # Column articles are ranked by category on.
+    category_column = "category"
 
     @classmethod
     async def get(cls, db: AsyncSession, _id: str) -> Optional[TableType]:
@@ -35,25 +69,427 @@ class BasePostgresService(Generic[TableType]):
         return result.all()
 
     @classmethod
-    async def bulk_upsert(cls, db: AsyncSession, obj_list: list[dict]):
+    def on_conflict_update(cls, stmt, update_count=True):
+        """
+        Add ON CONFLICT (url) DO UPDATE to an insert statement of the dialect. Rows whose
+        comment count, score and rescoring state are unchanged aren't rewritten, saving
+        dead tuples and WAL on repeated crawls, unless they were scored again: score_time
+        tells the dedup seed (stream_identifiers_scored_since) the score is recent.
+        update_time only moves when content changed, see upsert_returning.
+
+        Args:
+            update_count: False for rows without a known comment count, which keep the stored one.
+        """
+        model, excluded = cls.model, stmt.excluded
+        changed = or_(
+            model.needs_rescore.is_distinct_from(excluded.needs_rescore),
+            and_(not_(excluded.needs_rescore), model.score.is_distinct_from(excluded.score))
+        )
+        if update_count:
+            changed = or_(model.comment_count.is_distinct_from(excluded.comment_count), changed)
+        rescored = and_(
+            not_(excluded.needs_rescore),
+            excluded.score_time.is_not(None),
+            or_(model.score_time.is_(None), excluded.score_time > model.score_time)
+        )
+        set_ = {
+            # Articles that failed scoring keep their stored score.
+            "score": case((excluded.needs_rescore, model.score), else_=excluded.score),
+            "score_time": case((excluded.needs_rescore, model.score_time), else_=excluded.score_time),
+            "needs_rescore": excluded.needs_rescore,
+            "identifier": excluded.identifier,
+            "update_time": case((changed, current_timestamp()), else_=model.update_time)
+        }
+        if update_count:
+            set_["comment_count"] = excluded.comment_count
+        return stmt.on_conflict_do_update(index_elements=['url'], set_=set_, where=or_(changed, rescored))
+
+    @classmethod
+    def upsert_returning(cls, stmt):
+        """
+        Return inserted and updated rows from an upsert when keeping score history, as
+        (id, comment_count, score, changed). changed is False for rows only given a newer
+        score_time, which update_time tells as it's only set to now when content changed.
+        SQLite's CURRENT_TIMESTAMP has second resolution, so there rows updated twice within
+        a second count as changed.
+        """
+        if cls.record_history:
+            return stmt.returning(
+                cls.model.id, cls.model.comment_count, cls.model.score,
+                (cls.model.update_time == current_timestamp()).label("changed")
+            )
+        return stmt
+
+    @classmethod
+    async def bulk_upsert(cls, db: AsyncSession, obj_list: list[dict], method: Optional[str] = None):
         """
         Utilize Postgres' ON CONFLICT DO UPDATE to bulk upsert items.
+
+        Args:
+            obj_list: Rows to upsert. All must have the same keys.
+            method: "values", "copy" or "executemany", see upsert_method. Default to the service's.
         """
         logger.debug("Upserting %d objects into db..." % len(obj_list))
-        stmt = insert(cls.model).values(obj_list)
-        stmt = stmt.on_conflict_do_update(
-            index_elements=['url'],
-            set_={
-                "score": stmt.excluded.score,
-                "update_time": current_timestamp()
-            }
+        method = method or cls.upsert_method
+        # Rows whose comment count is None (missing from the count API) don't update it, so
+        # stored articles keep their count. New ones are inserted with 0.
+        counted = [obj for obj in obj_list if obj.get("comment_count", 0) is not None]
+        uncounted = [{**obj, "comment_count": 0} for obj in obj_list if obj.get("comment_count", 0) is None]
+        for rows in (counted, uncounted):
+            if not rows:
+                continue
+            update_count = rows is counted
+            if method == "copy" and db.dialect.name == "postgresql":
+                # Writes its own history rows.
+                await cls.copy_upsert(db, rows, update_count)
+                continue
+            if method == "executemany":
+                changed = await cls.executemany_upsert(db, rows, update_count)
+            else:
+                changed = await cls.values_upsert(db, rows, update_count)
+            await cls.add_score_history(db, changed)
+            await db.commit()
+
+    @classmethod
+    async def values_upsert(cls, db: AsyncSession, obj_list: list[dict], update_count=True) -> list:
+        """
+        INSERT ... VALUES ... ON CONFLICT, split so no statement goes over the bind parameter limit.
+        Return upsert_returning rows if keeping history.
+        """
+        insert = dialect_insert[db.dialect.name]
+        chunk_size = max(1, MAX_BIND_PARAMS // len(obj_list[0]))
+        changed = []
+        for start in range(0, len(obj_list), chunk_size):
+            stmt = cls.on_conflict_update(insert(cls.model).values(obj_list[start:start + chunk_size]), update_count)
+            result = await db.execute(cls.upsert_returning(stmt))
+            if cls.record_history:
+                changed.extend(result.fetchall())
+        return changed
+
+    @classmethod
+    async def executemany_upsert(cls, db: AsyncSession, obj_list: list[dict], update_count=True) -> list:
+        """
+        Run the same single-row INSERT ... ON CONFLICT for every row in one round of executemany.
+        Return upsert_returning rows if keeping history.
+        With RETURNING, SQLAlchemy batches the rows into fixed size multi-row statements instead.
+        """
+        insert = dialect_insert[db.dialect.name]
+        stmt = cls.on_conflict_update(insert(cls.model), update_count)
+        result = await db.execute(cls.upsert_returning(stmt), obj_list)
+        return result.fetchall() if cls.record_history else []
+
+    @classmethod
+    async def copy_upsert(cls, db: AsyncSession, obj_list: list[dict], update_count=True):
+        """
+        Binary COPY rows into a temporary staging table, then move them over with a single
+        INSERT ... SELECT ... ON CONFLICT. History rows are COPYed in the same transaction.
+        Postgres (asyncpg) only.
+        """
+        table_name = cls.model.__tablename__
+        staging_name = f"staging_{table_name}"
+        columns = list(obj_list[0])
+        staging = table(staging_name, *(column(name) for name in columns))
+        # ON CONFLICT can't update the same row twice in one statement.
+        select_stmt = select(*(staging.c[name] for name in columns)).distinct(staging.c.url)
+        stmt = cls.on_conflict_update(postgresql.insert(cls.model).from_select(columns, select_stmt), update_count)
+        upsert_sql = str(cls.upsert_returning(stmt).compile(dialect=db.dialect))
+
+        raw_conn = await db.get_raw_connection()
+        asyncpg_conn = raw_conn.driver_connection
+        column_list = ", ".join(columns)
+        async with asyncpg_conn.transaction():
+            # Same column types as the target table, without its constraints and defaults.
+            await asyncpg_conn.execute(
+                f"CREATE TEMP TABLE {staging_name} ON COMMIT DROP AS "
+                f"SELECT {column_list} FROM {table_name} WITH NO DATA"
+            )
+            await asyncpg_conn.copy_records_to_table(
+                staging_name,
+                records=[tuple(obj[name] for name in columns) for obj in obj_list],
+                columns=columns
+            )
+            changed = [row for row in await asyncpg_conn.fetch(upsert_sql) if row[3]]
+            if changed:
+                observed_at = datetime.now(timezone.utc)
+                await asyncpg_conn.copy_records_to_table(
+                    score_history.name,
+                    records=[(cls.site, row[0], observed_at, row[1], row[2]) for row in changed],
+                    columns=[c.name for c in score_history.columns]
+                )
+
+    @classmethod
+    async def add_score_history(cls, db: AsyncSession, changed):
+        """
+        Record upsert_returning rows whose content changed in score_history, observed now. Doesn't commit.
+        """
+        if not cls.record_history:
+            return
+        observed_at = datetime.now(timezone.utc)
+        rows = [
+            {"site": cls.site, "article_id": row[0], "observed_at": observed_at, "comment_count": row[1], "score": row[2]}
+            for row in changed if row[3]
+        ]
+        if not rows:
+            return
+        insert = dialect_insert[db.dialect.name]
+        chunk_size = MAX_BIND_PARAMS // len(score_history.columns)
+        for start in range(0, len(rows), chunk_size):
+            await db.execute(insert(score_history).values(rows[start:start + chunk_size]).on_conflict_do_nothing())
+
+    @classmethod
+    async def get_score_history(cls, db: AsyncSession, article_id: int):
+        """
+        Comment count and score of an article over time, oldest first.
+        """
+        query = (
+            select(score_history.c.observed_at, score_history.c.comment_count, score_history.c.score)
+            .where(score_history.c.site == cls.site, score_history.c.article_id == article_id)
+            .order_by(score_history.c.observed_at)
+        )
+        result = await db.execute(query)
+        await db.commit()
+        return result.fetchall()
+
+    @classmethod
+    async def claim_rescore_batch(
+        cls, db: AsyncSession, worker: str, limit: int, stale_before: Optional[datetime] = None,
+        claimed_before: Optional[datetime] = None
+    ) -> list:
+        """
+        Claim up to limit articles to score for worker and commit: those marked for rescoring,
+        and those scored before stale_before if given. Articles claimed by other workers are
+        skipped, unless claimed before claimed_before. Rows are only locked while claiming,
+        so the crawl's upserts don't wait for scoring.
+        Claims are released by bulk_update_scores.
+        """
+        condition = cls.model.needs_rescore
+        if stale_before is not None:
+            condition = or_(condition, cls.model.score_time < stale_before)
+        unclaimed = cls.model.claimed_at.is_(None)
+        if claimed_before is not None:
+            unclaimed = or_(unclaimed, cls.model.claimed_at < claimed_before)
+        claimable = (
+            select(cls.model.id)
+            .where(condition, unclaimed, cls.model.comment_count > 0, cls.model.identifier.is_not(None))
+            # Failed attempts bump update_time, so they go to the back of the line.
+            .order_by(cls.model.update_time)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+        )
+        stmt = (
+            update(cls.model)
+            .where(cls.model.id.in_(claimable.scalar_subquery()))
+            .values(claimed_by=worker, claimed_at=datetime.now(timezone.utc))
+            .returning(*cls.model.__table__.columns)
+        )
+        result = await db.execute(stmt)
+        rows = result.all()
+        await db.commit()
+        return rows
+
+    @classmethod
+    async def bulk_update_scores(cls, db: AsyncSession, score_list: list[dict], worker: str):
+        """
+        Save scores by id, release worker's claims and commit. Articles whose claim expired
+        and went to another worker are left to it.
+
+        Args:
+            score_list: [{"id": id, "score": score, "needs_rescore": bool, "comment_count": int,
+                "previous_score": int}]
+                Articles still needing rescoring keep their score. Scores differing from
+                previous_score are recorded in score_history.
+        """
+        stmt = (
+            update(cls.model)
+            .where(cls.model.id == bindparam("b_id"), cls.model.claimed_by == worker)
+            .values(
+                score=case((bindparam("b_needs_rescore"), cls.model.score), else_=bindparam("b_score")),
+                score_time=case((bindparam("b_needs_rescore"), cls.model.score_time), else_=current_timestamp()),
+                needs_rescore=bindparam("b_needs_rescore"),
+                claimed_by=None,
+                claimed_at=None,
+                update_time=current_timestamp()
+            )
+        )
+        await db.execute(stmt, [
+            {"b_id": obj["id"], "b_score": obj["score"], "b_needs_rescore": obj["needs_rescore"]}
+            for obj in score_list
+        ])
+        await cls.add_score_history(db, [
+            (obj["id"], obj["comment_count"], obj["score"], True) for obj in score_list
+            if not obj["needs_rescore"] and obj["score"] != obj.get("previous_score")
+        ])
+        await db.commit()
+
+    @classmethod
+    async def stream_identifiers_scored_since(cls, db: AsyncSession, since: datetime, page_size=10000) -> AsyncIterator[str]:
+        """
+        Yield identifiers of articles scored at or after since, not needing a rescore.
+        """
+        query = (
+            select(cls.model.identifier)
+            .where(cls.model.score_time >= since, not_(cls.model.needs_rescore), cls.model.identifier.is_not(None))
+            .execution_options(yield_per=page_size)
         )
-        await db.execute(stmt)
+        result = await db.stream(query)
+        async for identifier in result.scalars():
+            yield identifier
         await db.commit()
 
+    @classmethod
+    async def delete_published_before(cls, db: AsyncSession, cutoff: datetime, batch_size=10000) -> int:
+        """
+        Delete articles published before cutoff, and their score history, batch_size rows per
+        transaction so the crawl's writes don't wait long. Return the number deleted.
+        """
+        published = getattr(cls.model, cls.published_column)
+        deleted = 0
+        while True:
+            batch = select(cls.model.id).where(published < cutoff).limit(batch_size).scalar_subquery()
+            result = await db.execute(delete(cls.model).where(cls.model.id.in_(batch)).returning(cls.model.id))
+            ids = result.scalars().all()
+            if ids:
+                await db.execute(
+                    delete(score_history).where(score_history.c.site == cls.site, score_history.c.article_id.in_(ids))
+                )
+            await db.commit()
+            deleted += len(ids)
+            if len(ids) < batch_size:
+                break
+        logger.info("Deleted %d %s articles published before %s", deleted, cls.site, cutoff)
+        return deleted
+
     @classmethod
     async def get_all_article_ranked(cls, db: AsyncSession):
         query = select(cls.model).order_by(cls.model.score.desc())
         result = await db.execute(query)
         await db.commit()
-        return result.fetchall()
\ No newline at end of file
+        return result.fetchall()
+
+    @classmethod
+    async def stream_article_ranked(
+        cls, db: AsyncSession, columns=("score", "url"), since: Optional[datetime] = None,
+        limit: Optional[int] = None, page_size=1000
+    ) -> AsyncIterator[dict]:
+        """
+        Yield articles as {column: value} by score, highest first, with only the given columns.
+        published_column can be selected as "published_time".
+
+        Read in pages of page_size with keyset pagination on (score, id), each page streamed
+        from a server side cursor in its own short transaction, so memory use stays flat and
+        no transaction is held open for the whole export.
+
+        Args:
+            since: Only articles published at or after this.
+            limit: Stop after this many articles. None for all.
+        """
+        published = getattr(cls.model, cls.published_column)
+        selected = [
+            published.label("published_time") if name == "published_time" else getattr(cls.model, name)
+            for name in columns
+        ]
+        base_query = select(cls.model.id, cls.model.score, *selected)
+        if since is not None:
+            base_query = base_query.where(published >= since)
+        base_query = base_query.order_by(cls.model.score.desc(), cls.model.id.desc())
+
+        yielded = 0
+        last_score = last_id = None
+        while limit is None or yielded < limit:
+            query = base_query
+            if last_id is not None:
+                query = query.where(or_(
+                    cls.model.score < last_score,
+                    and_(cls.model.score == last_score, cls.model.id < last_id)
+                ))
+            batch = page_size if limit is None else min(page_size, limit - yielded)
+            result = await db.stream(query.limit(batch).execution_options(yield_per=batch))
+            count = 0
+            async for row in result:
+                count += 1
+                last_id, last_score = row[0], row[1]
+                yield dict(zip(columns, row[2:]))
+            await db.commit()
+            yielded += count
+            if count < batch:
+                break
+
+    @classmethod
+    def ranking_view_name(cls, window: str) -> str:
+        return f"{cls.model.__tablename__}_top_{window}"
+
+    @classmethod
+    def ranking_query(cls, published_since):
+        """
+        Articles published since published_since ranked by score within their category,
+        up to RANKING_DEPTH per category.
+        """
+        model = cls.model
+        category = getattr(model, cls.category_column)
+        published = getattr(model, cls.published_column)
+        ranked = select(
+            category.label("category"), model.url, model.title, model.score, model.comment_count,
+            published.label("published_time"),
+            func.row_number().over(partition_by=category, order_by=(model.score.desc(), model.id)).label("rank")
+        ).where(published >= published_since).subquery()
+        return select(ranked).where(ranked.c.rank <= RANKING_DEPTH)
+
+    @classmethod
+    async def create_ranking_views(cls, db: AsyncSession):
+        """
+        Create ranking indexes on tables created before them, and one materialized view
+        per RANKING_WINDOWS. Postgres only, other databases rank on the fly in get_top.
+        """
+        if db.dialect.name != "postgresql":
+            return
+        await db.run_sync(lambda sync_db: [
+            index.create(sync_db, checkfirst=True) for index in cls.model.__table__.indexes
+        ])
+        for window, length in RANKING_WINDOWS.items():
+            # Window is evaluated on refresh, not creation.
+            since = func.now() - literal_column(f"interval '{int(length.total_seconds())} seconds'")
+            query = cls.ranking_query(since).compile(dialect=db.dialect, compile_kwargs={"literal_binds": True})
+            view = cls.ranking_view_name(window)
+            await db.execute(text(f"CREATE MATERIALIZED VIEW IF NOT EXISTS {view} AS {query}"))
+            # Unique index lets REFRESH ... CONCURRENTLY keep the view readable while refreshing.
+            await db.execute(text(f"CREATE UNIQUE INDEX IF NOT EXISTS ix_{view}_rank ON {view} (category, rank)"))
+        await db.commit()
+
+    @classmethod
+    async def refresh_ranking_views(cls, db: AsyncSession, concurrently=True):
+        """
+        Recompute ranking views. Postgres only.
+        """
+        if db.dialect.name != "postgresql":
+            return
+        for window in RANKING_WINDOWS:
+            option = "CONCURRENTLY " if concurrently else ""
+            await db.execute(text(f"REFRESH MATERIALIZED VIEW {option}{cls.ranking_view_name(window)}"))
+        await db.commit()
+        logger.info("Refreshed %s ranking views", cls.model.__tablename__)
+
+    @classmethod
+    async def get_top(cls, db: AsyncSession, window="24h", limit=10, category: Optional[str] = None):
+        """
+        Top articles published in the window per category, ordered by category then rank.
+        Read from the ranking view on Postgres, so as fresh as its last refresh.
+
+        Args:
+            window: One of RANKING_WINDOWS.
+            limit: Articles per category, up to RANKING_DEPTH.
+            category: Only this category. None for all.
+        """
+        if db.dialect.name == "postgresql":
+            ranked = table(
+                cls.ranking_view_name(window),
+                *(column(name) for name in ("category", "url", "title", "score", "comment_count", "published_time", "rank"))
+            )
+        else:
+            since = datetime.now(timezone.utc) - RANKING_WINDOWS[window]
+            ranked = cls.ranking_query(since).subquery()
+        query = select(ranked).where(ranked.c.rank <= limit)
+        if category is not None:
+            query = query.where(ranked.c.category == category)
+        result = await db.execute(query.order_by(ranked.c.category, ranked.c.rank))
+        await db.commit()
+        return result.fetchall()
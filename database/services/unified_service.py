@@ -0,0 +1,154 @@
+from logging import getLogger
+from datetime import datetime, timezone
+from typing import Optional, Type
+from sqlalchemy import and_, func, literal, select, text, true
+from sqlalchemy.sql.functions import current_timestamp
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.schema.unified import article
+from .postgres_service import BasePostgresService, dialect_insert
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+def month_start(time: datetime) -> datetime:
+    return datetime(time.year, time.month, 1, tzinfo=timezone.utc)
+
+def add_months(time: datetime, months: int) -> datetime:
+    """Start of the month `months` after the month of time. Negative to go back."""
+    index = time.year * 12 + time.month - 1 + months
+    return datetime(index // 12, index % 12 + 1, 1, tzinfo=timezone.utc)
+
+def partition_name(month: datetime) -> str:
+    return f"{article.name}_p{month:%Y%m}"
+
+def retention_cutoff(keep_months: int) -> Optional[datetime]:
+    """
+    Start of the oldest month kept when keeping keep_months before this one. None to keep all.
+    """
+    if not keep_months:
+        return None
+    return add_months(datetime.now(timezone.utc), -keep_months)
+
+
+class UnifiedArticleService:
+    """
+    Cross-site article table, filled from the per-site tables. Partitions are Postgres only,
+    other databases get a plain table. Retention drops its partitions and deletes from the
+    site tables, so neither grows without bound.
+    """
+    table = article
+
+    @classmethod
+    async def ensure_partitions(cls, db: AsyncSession, start: datetime, end: datetime):
+        """
+        Create monthly partitions covering start to end, both included.
+        """
+        if db.dialect.name != "postgresql":
+            return
+        month = month_start(start)
+        while month <= end:
+            upper = add_months(month, 1)
+            await db.execute(text(
+                f"CREATE TABLE IF NOT EXISTS {partition_name(month)} PARTITION OF {article.name} "
+                f"FOR VALUES FROM ('{month.isoformat()}') TO ('{upper.isoformat()}')"
+            ))
+            month = upper
+        await db.commit()
+
+    @classmethod
+    async def list_partitions(cls, db: AsyncSession) -> list[str]:
+        if db.dialect.name != "postgresql":
+            return []
+        result = await db.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class parent ON pg_inherits.inhparent = parent.oid "
+            "JOIN pg_class child ON pg_inherits.inhrelid = child.oid "
+            "WHERE parent.relname = :parent ORDER BY child.relname"
+        ), {"parent": article.name})
+        await db.commit()
+        return [row[0] for row in result]
+
+    @classmethod
+    async def drop_partitions_before(cls, db: AsyncSession, cutoff: datetime) -> list[str]:
+        """
+        Drop partitions of months ending at or before cutoff. Return their names.
+        Other databases delete the rows instead.
+        """
+        if db.dialect.name != "postgresql":
+            await db.execute(article.delete().where(article.c.published_time < month_start(cutoff)))
+            await db.commit()
+            return []
+        dropped = []
+        prefix = f"{article.name}_p"
+        for name in await cls.list_partitions(db):
+            if not name.startswith(prefix):
+                continue
+            month = datetime.strptime(name[len(prefix):], "%Y%m").replace(tzinfo=timezone.utc)
+            if add_months(month, 1) <= cutoff:
+                await db.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+        await db.commit()
+        if dropped:
+            logger.info("Dropped partitions %s", ", ".join(dropped))
+        return dropped
+
+    @classmethod
+    async def sync_from_site(
+        cls, db: AsyncSession, site: str, DBService: Type[BasePostgresService], since: Optional[datetime] = None,
+        keep_since: Optional[datetime] = None
+    ):
+        """
+        Upsert rows of a site table updated since `since` (all if None) into the unified table,
+        creating the partitions they need first. Rows published before the month of keep_since
+        are skipped, so partitions dropped by retention aren't created again.
+
+        Return:
+            Rows upserted
+        """
+        model = DBService.model
+        published = getattr(model, DBService.published_column)
+        condition = true() if since is None else model.update_time >= since
+        if keep_since is not None:
+            condition = and_(condition, published >= month_start(keep_since))
+        time_range = await db.execute(select(func.min(published), func.max(published)).where(condition))
+        oldest, newest = time_range.one()
+        if oldest is None:
+            await db.commit()
+            return 0
+        if isinstance(oldest, datetime) and oldest.tzinfo is None:
+            # SQLite returns naive datetimes
+            oldest, newest = oldest.replace(tzinfo=timezone.utc), newest.replace(tzinfo=timezone.utc)
+        await cls.ensure_partitions(db, oldest, newest)
+
+        columns = ["site", "url", "published_time", "title", "category", "score", "comment_count", "identifier"]
+        select_stmt = select(
+            literal(site), model.url, published, model.title, getattr(model, DBService.category_column),
+            model.score, model.comment_count, model.identifier
+        ).where(condition)
+        stmt = dialect_insert[db.dialect.name](article).from_select(columns, select_stmt)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=["site", "url", "published_time"],
+            set_={
+                "title": stmt.excluded.title,
+                "category": stmt.excluded.category,
+                "score": stmt.excluded.score,
+                "comment_count": stmt.excluded.comment_count,
+                "identifier": stmt.excluded.identifier,
+                "update_time": current_timestamp()
+            }
+        )
+        result = await db.execute(stmt)
+        await db.commit()
+        logger.info("Synced %d %s articles to %s", result.rowcount, site, article.name)
+        return result.rowcount
+
+    @classmethod
+    async def get_top(cls, db: AsyncSession, since: datetime, limit=10):
+        """
+        Top articles of all sites published since `since`. Only scans partitions in range.
+        """
+        query = select(article).where(article.c.published_time >= since).order_by(article.c.score.desc()).limit(limit)
+        result = await db.execute(query)
+        await db.commit()
+        return result.fetchall()
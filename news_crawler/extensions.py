@@ -0,0 +1,57 @@
+# Define here the extensions of the crawler
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/extensions.html
+import asyncio
+from logging import getLogger
+
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+
+from news_crawler.score import ScoringWorker
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class ScoringStage:
+    """
+    Run the scoring worker inside the crawl process, next to a crawl in deferred scorer mode.
+    Enabled by SCORING_WORKER_SETTINGS IN_PROCESS.
+    """
+
+    def __init__(self, crawler):
+        self.crawler = crawler
+        self.worker = None
+        self._task = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        scorer_settings = crawler.settings.getdict("SCORER_SETTINGS")
+        worker_settings = crawler.settings.getdict("SCORING_WORKER_SETTINGS")
+        if scorer_settings.get("MODE") != "deferred" or not worker_settings.get("IN_PROCESS"):
+            raise NotConfigured
+        stage = cls(crawler)
+        crawler.signals.connect(stage.item_scraped, signal=signals.item_scraped)
+        # After spider_closed, so the Postgres pipeline has flushed every article.
+        crawler.signals.connect(stage.engine_stopped, signal=signals.engine_stopped)
+        return stage
+
+    def item_scraped(self, item, spider):
+        # Start with the first scraped article. The engine waits for every spider_opened handler,
+        # including the Postgres pipeline's creating the tables, before it sends any request.
+        # Articles are only buffered by the pipeline then, the worker finds them once flushed.
+        if self.worker is None:
+            self.worker = ScoringWorker.from_settings(self.crawler.settings, spider.name, stats=self.crawler.stats)
+            self.worker.scorer.open()
+            self._task = asyncio.ensure_future(self.worker.run())
+            logger.info("Started in-process scoring worker for %s", spider.name)
+
+    async def engine_stopped(self):
+        if self.worker is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        # Score what the last flush stored.
+        await self.worker.run(once=True)
+        await self.worker.close()
+        logger.info("In-process scoring worker finished")
@@ -0,0 +1,76 @@
+"""
+Site categories discovered from navigation, cached between runs.
+"""
+import json
+import os
+from datetime import datetime, timedelta
+from logging import getLogger
+from pathlib import Path
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class CategoryIndex:
+    """
+    Category index stored as JSON:
+    {
+        "discovered_at": unix timestamp categories were discovered,
+        "categories": {category id: name},
+        "empty": {category id: unix timestamp a finished crawl last found it empty}
+    }
+    """
+
+    def __init__(self, path, ttl: timedelta, empty_ttl: timedelta):
+        """
+        Args:
+            ttl: Age after which categories should be discovered again.
+            empty_ttl: How long a category found empty is skipped.
+        """
+        self.path = Path(path)
+        self.ttl = ttl
+        self.empty_ttl = empty_ttl
+        self.discovered_at = None
+        self.categories = {}
+        self.empty = {}
+        if self.path.exists():
+            with open(self.path) as f:
+                index = json.load(f)
+            self.discovered_at = index.get("discovered_at")
+            self.categories = index.get("categories", {})
+            self.empty = index.get("empty", {})
+        logger.info("Loaded category index %s: %d categories", self.path, len(self.categories))
+
+    def is_fresh(self, now: datetime) -> bool:
+        return bool(self.categories) and self.discovered_at is not None and now.timestamp() - self.discovered_at < self.ttl.total_seconds()
+
+    def set_categories(self, categories: dict, now: datetime):
+        self.categories = {str(category_id): name for category_id, name in categories.items()}
+        self.discovered_at = now.timestamp()
+
+    def crawlable(self, categories: dict, now: datetime) -> dict:
+        """
+        categories without those found empty within empty_ttl.
+        """
+        skip_after = now.timestamp() - self.empty_ttl.total_seconds()
+        crawlable = {
+            category_id: name for category_id, name in categories.items()
+            if self.empty.get(str(category_id), 0) < skip_after
+        }
+        if len(crawlable) < len(categories):
+            logger.info("Skipped %d recently empty categories", len(categories) - len(crawlable))
+        return crawlable
+
+    def record_article_count(self, category_id, count: int, now: datetime):
+        if count:
+            self.empty.pop(str(category_id), None)
+        else:
+            self.empty[str(category_id)] = now.timestamp()
+
+    def save(self):
+        """Write index atomically."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump({"discovered_at": self.discovered_at, "categories": self.categories, "empty": self.empty}, f)
+        os.replace(tmp_path, self.path)
+        logger.info("Saved category index %s: %d categories, %d empty", self.path, len(self.categories), len(self.empty))
@@ -1,3 +1,4 @@
 from .base_counter import BaseCounter
 from .vnexpress_counter import VnExpressCounter
-from .tuoitre_counter import TuoiTreCounter
\ No newline at end of file
+from .tuoitre_counter import TuoiTreCounter
+from .batcher import CommentCountBatcher
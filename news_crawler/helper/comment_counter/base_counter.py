@@ -24,9 +24,18 @@ class BaseCounter(ABC):
         """
         return ""
 
-    @abstractmethod
     def parse_comment_count_response(self, response) -> dict:
         """
+        Return:
+            dict: {identifier: comment_count}
+        """
+        return self.parse_comment_count_text(response.text)
+
+    @abstractmethod
+    def parse_comment_count_text(self, text: str) -> dict:
+        """
+        parse_comment_count_response on the response body alone, so it can run in another process.
+
         Return:
             dict: {identifier: comment_count}
         """
@@ -0,0 +1,67 @@
+"""
+Comment count requests for articles of several listing pages at once.
+"""
+from time import monotonic
+from typing import Callable, Optional
+
+from scrapy import Request
+
+from .base_counter import BaseCounter
+
+
+class CommentCountBatcher:
+    """
+    Collect articles across listing pages into comment count requests of up to max_ids
+    articles, whose URL stays under max_url_length characters.
+    A batch is sent once full, or by whoever calls flush() once it's due.
+    """
+
+    def __init__(
+        self, counter: BaseCounter, make_request: Callable[[list], Request],
+        max_ids=100, max_url_length=2000, max_wait=1.0
+    ):
+        """
+        Args:
+            make_request: Build the comment count request of a list of articles.
+            max_wait: Seconds the oldest article may wait for its batch to fill.
+        """
+        self.counter = counter
+        self.make_request = make_request
+        self.max_ids = max_ids
+        self.max_url_length = max_url_length
+        self.max_wait = max_wait
+        self.pending = []
+        self._url_length = self._base_url_length = len(counter.make_comment_count_url([]))
+        self._started: Optional[float] = None
+
+    def add(self, articles: list) -> list[Request]:
+        """
+        Queue articles. Return requests of the batches they filled.
+        """
+        requests = []
+        for article in articles:
+            # Every article adds a separator and its identifier to the URL.
+            length = len(article.identifier) + 1
+            if self.pending and self._url_length + length > self.max_url_length:
+                requests += self.flush()
+            if not self.pending:
+                self._started = monotonic()
+            self.pending.append(article)
+            self._url_length += length
+            if len(self.pending) >= self.max_ids:
+                requests += self.flush()
+        return requests
+
+    def is_due(self) -> bool:
+        return bool(self.pending) and monotonic() - self._started >= self.max_wait
+
+    def flush(self) -> list[Request]:
+        """
+        Return the request of the pending batch, if any.
+        """
+        if not self.pending:
+            return []
+        batch, self.pending = self.pending, []
+        self._url_length = self._base_url_length
+        self._started = None
+        return [self.make_request(batch)]
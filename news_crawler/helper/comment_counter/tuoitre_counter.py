@@ -1,5 +1,6 @@
 from functools import reduce
 from .base_counter import BaseCounter
+from news_crawler.helper import json_backend
 
 class TuoiTreCounter(BaseCounter):
     """
@@ -18,17 +19,17 @@ class TuoiTreCounter(BaseCounter):
         aids = reduce(lambda ac, article: f"{ac},{article.identifier}", article_list, "")
         return f"{self.comment_count_api}?ids={aids}"
 
-    def parse_comment_count_response(self, response):
+    def parse_comment_count_text(self, text):
         """
         Comment count api gives response in format:
         {"Success": true|false, "Data":[{comment_count:0,total_count:0,object_id:id},{}]}
         Return in readable format
 
         Args:
-            response: Response in the format above.
+            text: Response body in the format above.
 
         Return:
             dict: {identifier: comment_count}
         """
-        json_resp = response.json().get("Data", [])
+        json_resp = json_backend.loads(text).get("Data", [])
         return {item["object_id"]:item["total_count"] or 0 for item in json_resp}
\ No newline at end of file
@@ -22,19 +22,19 @@ class VnExpressCounter(BaseCounter):
         query = reduce(lambda ac, article: f"{ac};{article.identifier}", article_list, "")
         return f"{self.comment_count_api}?cid={query}"
 
-    def parse_comment_count_response(self, response) -> str:
+    def parse_comment_count_text(self, text) -> dict:
         """
         Comment count api gives response in format:
         CmtWidget.parse('widget-comment-%full-identifier%', %comment-count%);...
         Return in readable format
 
         Args:
-            response: Response in the format above.
+            text: Response body in the format above.
 
         Return:
             dict: {full-identifier: comment_count}
         """
-        str_resp = response.text
+        str_resp = text
         comment_counts = map(int, re.findall(r"(?<=\s)(\d+)", str_resp))
         # Because we can't be sure about the order of returned result,
         # we will also store the corresponding full-identifier
@@ -0,0 +1,74 @@
+"""
+Crawl-wide index of articles already seen, so an article listed on several pages
+(e.g. in several VnExpress categories) is only counted, scored and stored once.
+"""
+from hashlib import blake2b
+from logging import getLogger
+from math import ceil, log
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class ExactSeen:
+    """Set of keys. Exact, memory grows with every key."""
+
+    def __init__(self):
+        self.keys = set()
+
+    def add(self, key: str) -> bool:
+        """Add key. Return True if it wasn't seen before."""
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        return True
+
+    def __len__(self):
+        return len(self.keys)
+
+
+class BloomSeen:
+    """
+    Bloom filter of keys. Fixed memory, about 1.8 bytes per key of capacity at 0.1% error rate.
+    A false positive drops an article that wasn't actually seen, with probability error_rate
+    while under capacity.
+    """
+
+    def __init__(self, capacity=1_000_000, error_rate=0.001):
+        self.bit_size = ceil(-capacity * log(error_rate) / log(2) ** 2)
+        self.hash_count = max(1, round(self.bit_size / capacity * log(2)))
+        self.bits = bytearray((self.bit_size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions from two 64 bit halves of one digest.
+        digest = blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bit_size for i in range(self.hash_count)]
+
+    def add(self, key: str) -> bool:
+        """Add key. Return True if it wasn't seen before."""
+        new = False
+        for position in self._positions(key):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                self.bits[byte] |= 1 << bit
+                new = True
+        self.count += new
+        return new
+
+    def __len__(self):
+        return self.count
+
+
+def make_seen(mode="set", capacity=1_000_000, error_rate=0.001):
+    """
+    Seen article index for DEDUP_SETTINGS MODE: "set", "bloom", or "off" for None.
+    """
+    if mode == "off":
+        return None
+    if mode == "bloom":
+        return BloomSeen(capacity, error_rate)
+    if mode == "set":
+        return ExactSeen()
+    raise ValueError(f"Unknown dedup mode {mode}")
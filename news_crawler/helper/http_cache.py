@@ -0,0 +1,265 @@
+"""
+Persistent HTTP response cache shared by Scrapy downloads and the scorer's comment API requests.
+
+One SQLite file, bounded in size by evicting the least recently used responses. Responses of
+endpoints with a TTL (HTTP_CACHE_SETTINGS TTLS) are fresh for that long whatever their headers
+say, then revalidated with ETag/Last-Modified when they had one. Other responses follow
+RFC 2616 like Scrapy's default policy.
+"""
+import json
+import re
+import sqlite3
+from logging import getLogger
+from pathlib import Path
+from time import time
+from typing import NamedTuple, Optional
+
+from scrapy.downloadermiddlewares.httpcache import HttpCacheMiddleware
+from scrapy.extensions.httpcache import RFC2616Policy
+from scrapy.http import Headers
+from scrapy.responsetypes import responsetypes
+
+logger = getLogger(f"scrapy.{__name__}")
+
+# Response headers kept in the cache. Enough to rebuild responses and revalidate them.
+KEPT_HEADERS = ("Content-Type", "Content-Encoding", "Date", "Expires", "Cache-Control", "ETag", "Last-Modified")
+
+_kept_names = {name.lower(): name for name in KEPT_HEADERS}
+
+
+def conditional_headers(cached_headers: dict) -> dict:
+    """
+    Request headers revalidating a cached response: the server answers 304 if it's unchanged.
+    """
+    headers = {}
+    if "ETag" in cached_headers:
+        headers["If-None-Match"] = cached_headers["ETag"]
+    if "Last-Modified" in cached_headers:
+        headers["If-Modified-Since"] = cached_headers["Last-Modified"]
+    return headers
+
+
+class CachedResponse(NamedTuple):
+    url: str
+    status: int
+    headers: dict
+    body: bytes
+    stored_at: float
+
+
+class EndpointTTLs:
+    """
+    {URL regex: seconds}. First pattern found in a URL gives its TTL.
+    Patterns are searched, so they also match URLs rewritten onto the replay server.
+    """
+
+    def __init__(self, ttls: dict):
+        self.ttls = [(re.compile(pattern), float(ttl)) for pattern, ttl in ttls.items()]
+
+    def ttl_for(self, url: str) -> Optional[float]:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return None
+
+
+class ResponseCache:
+    """
+    SQLite backed {key: response}, keeping at most max_bytes of bodies.
+    """
+    # {(path, max_bytes): (ResponseCache, reference count)} shared in this process, so Scrapy's
+    # storage and the scorers write through one connection.
+    _shared = {}
+    # Commit after this many writes, so a killed crawl keeps most of its work.
+    commit_every = 100
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS response ("
+            "key TEXT PRIMARY KEY, url TEXT NOT NULL, status INTEGER NOT NULL, headers TEXT NOT NULL, "
+            "body BLOB NOT NULL, size INTEGER NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_response_accessed_at ON response (accessed_at)")
+        self._size = self._conn.execute("SELECT coalesce(sum(size), 0) FROM response").fetchone()[0]
+        self._shared_key = None
+        self._pending_writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        logger.info("HTTP cache %s opened, %.1f MiB", path, self._size / 1024 / 1024)
+
+    @classmethod
+    def from_settings(cls, settings) -> Optional["ResponseCache"]:
+        """
+        Get the cache shared in this process, None when HTTP_CACHE_SETTINGS disables it.
+        Release with close().
+        """
+        cache_settings = settings.getdict("HTTP_CACHE_SETTINGS")
+        if not cache_settings.get("ENABLED") or not cache_settings.get("PATH"):
+            return None
+        key = (cache_settings["PATH"], int(float(cache_settings.get("MAX_MB", 512)) * 1024 * 1024))
+        cache, references = cls._shared.get(key, (None, 0))
+        if cache is None:
+            cache = cls(*key)
+            cache._shared_key = key
+        cls._shared[key] = (cache, references + 1)
+        return cache
+
+    def get(self, key) -> Optional[CachedResponse]:
+        row = self._conn.execute(
+            "SELECT url, status, headers, body, stored_at FROM response WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._write("UPDATE response SET accessed_at = ? WHERE key = ?", (time(), key))
+        url, status, headers, body, stored_at = row
+        return CachedResponse(url, status, json.loads(headers), body, stored_at)
+
+    def put(self, key, url, status, headers: dict, body: bytes):
+        headers = {
+            _kept_names[name.lower()]: value for name, value in headers.items() if name.lower() in _kept_names
+        }
+        old = self._conn.execute("SELECT size FROM response WHERE key = ?", (key,)).fetchone()
+        now = time()
+        self._write(
+            "INSERT OR REPLACE INTO response VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (key, url, status, json.dumps(headers), body, len(body), now, now)
+        )
+        self._size += len(body) - (old[0] if old else 0)
+        if self._size > self.max_bytes:
+            self.evict()
+
+    def refresh(self, key):
+        """Restart the TTL of a response revalidated by the server."""
+        now = time()
+        self._write("UPDATE response SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def evict(self):
+        """
+        Delete least recently used responses until the cache is down to 90% of max_bytes.
+        """
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, size FROM response ORDER BY accessed_at")
+        evicted = []
+        for key, size in rows:
+            if self._size <= target:
+                break
+            evicted.append((key,))
+            self._size -= size
+        self._conn.executemany("DELETE FROM response WHERE key = ?", evicted)
+        self._conn.commit()
+        self._pending_writes = 0
+        self.evicted += len(evicted)
+        logger.debug("Evicted %d responses from HTTP cache", len(evicted))
+
+    def _write(self, sql, params):
+        self._conn.execute(sql, params)
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        if self._shared_key is not None:
+            cache, references = self._shared[self._shared_key]
+            if references > 1:
+                self._shared[self._shared_key] = (cache, references - 1)
+                return
+            del self._shared[self._shared_key]
+        logger.info("HTTP cache closed: %d hits, %d misses, %d evicted", self.hits, self.misses, self.evicted)
+        self._conn.commit()
+        self._conn.close()
+
+
+class SqliteCacheStorage:
+    """
+    HTTPCACHE_STORAGE keeping Scrapy's responses in the shared ResponseCache.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.cache: Optional[ResponseCache] = None
+        self.fingerprinter = None
+
+    def open_spider(self, spider):
+        self.cache = ResponseCache.from_settings(self.settings)
+        if self.cache is None:
+            raise ValueError("SqliteCacheStorage needs HTTP_CACHE_SETTINGS ENABLED and PATH.")
+        self.fingerprinter = spider.crawler.request_fingerprinter
+
+    def close_spider(self, spider):
+        self.cache.close()
+
+    def _key(self, request):
+        return f"scrapy:{self.fingerprinter.fingerprint(request).hex()}"
+
+    def retrieve_response(self, spider, request):
+        cached = self.cache.get(self._key(request))
+        if cached is None:
+            return None
+        # Read by EndpointTTLPolicy, the rebuilt response doesn't carry it.
+        request.meta["http_cache_stored_at"] = cached.stored_at
+        headers = Headers(cached.headers)
+        respcls = responsetypes.from_args(headers=headers, url=cached.url, body=cached.body)
+        return respcls(url=cached.url, headers=headers, status=cached.status, body=cached.body)
+
+    def store_response(self, spider, request, response):
+        headers = {
+            name: response.headers[name].decode("latin-1")
+            for name in KEPT_HEADERS if response.headers.get(name) is not None
+        }
+        self.cache.put(self._key(request), response.url, response.status, headers, response.body)
+
+    def refresh(self, spider, request):
+        self.cache.refresh(self._key(request))
+
+
+class RevalidatingCacheMiddleware(HttpCacheMiddleware):
+    """
+    HttpCacheMiddleware, also restarting the TTL of cached responses the server revalidated
+    (304), which it returns without storing them again.
+    """
+
+    def process_response(self, request, response, spider):
+        cachedresponse = request.meta.get("cached_response")
+        result = super().process_response(request, response, spider)
+        if cachedresponse is not None and result is cachedresponse and hasattr(self.storage, "refresh"):
+            self.storage.refresh(spider, request)
+        return result
+
+
+class EndpointTTLPolicy(RFC2616Policy):
+    """
+    RFC2616Policy, except responses of endpoints in HTTP_CACHE_SETTINGS TTLS are cached when
+    successful and fresh for their TTL since they were stored or revalidated, regardless of
+    their caching headers.
+    """
+
+    def __init__(self, settings):
+        super().__init__(settings)
+        self.ttls = EndpointTTLs(settings.getdict("HTTP_CACHE_SETTINGS").get("TTLS", {}))
+
+    def should_cache_response(self, response, request):
+        if self.ttls.ttl_for(request.url) is not None:
+            return response.status == 200
+        return super().should_cache_response(response, request)
+
+    def is_cached_response_fresh(self, cachedresponse, request):
+        ttl = self.ttls.ttl_for(request.url)
+        if ttl is None:
+            return super().is_cached_response_fresh(cachedresponse, request)
+        stored_at = request.meta.get("http_cache_stored_at")
+        if stored_at is not None:
+            age = time() - stored_at
+        else:
+            # Stored by another storage, age from the Date header.
+            age = self._compute_current_age(cachedresponse, request, time())
+        if age < ttl:
+            return True
+        self._set_conditional_validators(request, cachedresponse)
+        return False
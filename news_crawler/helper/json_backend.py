@@ -0,0 +1,55 @@
+"""
+Fastest available JSON decoder: orjson, then msgspec, then the standard library.
+
+Install either optional package to speed up decoding comment API responses. JSON_BACKEND
+setting (or use_backend) picks one explicitly.
+"""
+import json
+from logging import getLogger
+
+logger = getLogger(f"scrapy.{__name__}")
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Raised on malformed JSON, and on JSON not matching a typed decoder's schema.
+DECODE_ERRORS = (ValueError,) + ((msgspec.DecodeError,) if msgspec is not None else ())
+
+_decoders = {"json": json.loads}
+if msgspec is not None:
+    _decoders["msgspec"] = msgspec.json.Decoder().decode
+if orjson is not None:
+    _decoders["orjson"] = orjson.loads
+
+# Preference order of available backends.
+available_backends = [name for name in ("orjson", "msgspec", "json") if name in _decoders]
+backend = available_backends[0]
+_loads = _decoders[backend]
+
+
+def use_backend(name=None):
+    """
+    Switch decoder. None or "auto" for the fastest available.
+    """
+    global backend, _loads
+    if name in (None, "", "auto"):
+        name = available_backends[0]
+    if name not in _decoders:
+        raise ValueError(f"JSON backend {name} isn't installed. Available: {', '.join(available_backends)}")
+    backend, _loads = name, _decoders[name]
+    logger.debug("Using %s to decode JSON", backend)
+
+
+def loads(data):
+    """
+    Decode JSON str or bytes. Module level so it can be sent to a process pool, where it
+    uses that process' default backend.
+    """
+    return _loads(data)
@@ -0,0 +1,72 @@
+"""
+Extract article blocks from listing pages with XPath compiled once per process.
+
+Selectors are written in CSS like the spiders' and translated with parsel's own translator,
+so results match response.css(...).get(). Compiled XPath runs directly on the lxml tree the
+response already parsed, instead of translating CSS and wrapping every match in a Selector.
+"""
+from typing import Optional
+
+from lxml.etree import XPath
+from parsel import Selector
+from parsel.csstranslator import css2xpath
+
+
+def first(xpath: XPath, node) -> Optional[str]:
+    """First string result of xpath on node, or None. Like Selector.get()."""
+    result = xpath(node)
+    if not result:
+        return None
+    value = result[0]
+    # Elements are serialized by Selector.get(). Listing fields are only attributes and text.
+    return str(value)
+
+
+class ListingParser:
+    """
+    Args:
+        block: CSS of one article block on the page.
+        fields: {name: CSS relative to a block}, using ::attr() or ::text.
+        page_fields: {name: CSS relative to the page}, extracted once per page.
+
+    Picklable, so parse_text can run in a process pool. XPath is recompiled on unpickling.
+    """
+
+    def __init__(self, block: str, fields: dict, page_fields: Optional[dict] = None):
+        self.queries = (block, fields, page_fields or {})
+        self._compile()
+
+    def _compile(self):
+        block, fields, page_fields = self.queries
+        self.block = XPath(css2xpath(block))
+        self.fields = {name: XPath(css2xpath(query)) for name, query in fields.items()}
+        self.page_fields = {name: XPath(css2xpath(query)) for name, query in page_fields.items()}
+
+    def __getstate__(self):
+        return self.queries
+
+    def __setstate__(self, queries):
+        self.queries = queries
+        self._compile()
+
+    def parse(self, response) -> tuple[dict, list[dict]]:
+        """
+        Return:
+            ({page field: value}, [{field: value} per block]). Missing values are None.
+        """
+        # lxml tree parsel already built for the response, so the page isn't parsed twice.
+        return self.parse_root(response.selector.root)
+
+    def parse_text(self, text: str) -> tuple[dict, list[dict]]:
+        """
+        parse on page HTML, parsing it first.
+        """
+        return self.parse_root(Selector(text=text).root)
+
+    def parse_root(self, root) -> tuple[dict, list[dict]]:
+        page = {name: first(xpath, root) for name, xpath in self.page_fields.items()}
+        blocks = [
+            {name: first(xpath, block) for name, xpath in self.fields.items()}
+            for block in self.block(root)
+        ]
+        return page, blocks
@@ -0,0 +1,91 @@
+"""
+Run CPU heavy parsing of large responses off the reactor thread.
+"""
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from logging import getLogger
+from typing import Optional
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class Offloader:
+    """
+    Run func(*args) in a process or thread pool when the input is at least `threshold` bytes,
+    inline otherwise: shipping small inputs to another process costs more than parsing them.
+
+    Modes:
+        "off": always inline.
+        "thread": thread pool. Only helps parsers that release the GIL, like lxml. json and re don't.
+        "process": process pool. func, args and result must be picklable.
+    """
+    # {(mode, workers, threshold): (Offloader, reference count)} shared in this process.
+    _shared = {}
+
+    def __init__(self, mode="off", workers: Optional[int] = None, threshold=256 * 1024):
+        if mode not in ("off", "thread", "process"):
+            raise ValueError(f"Unknown offload mode {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.threshold = threshold
+        self._executor: Optional[Executor] = None
+        self._shared_key = None
+        self.offloaded = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Get the offloader shared by spider and scorers of the same OFFLOAD_SETTINGS in this
+        process, so they use one pool. Release with close().
+        """
+        offload_settings = settings.getdict("OFFLOAD_SETTINGS")
+        key = (
+            offload_settings.get("MODE", "off"),
+            int(offload_settings.get("WORKERS", 0)) or None,
+            int(offload_settings.get("THRESHOLD", 256 * 1024))
+        )
+        offloader, references = cls._shared.get(key, (None, 0))
+        if offloader is None:
+            offloader = cls(*key)
+            offloader._shared_key = key
+        cls._shared[key] = (offloader, references + 1)
+        return offloader
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.mode == "process":
+                # Forking a process running the reactor and its threads isn't safe.
+                self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+            else:
+                self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix="offload")
+            logger.info("Started %s pool for parsing responses over %d bytes", self.mode, self.threshold)
+        return self._executor
+
+    def offloads(self, size) -> bool:
+        """Whether input of size bytes goes to the pool."""
+        return self.mode != "off" and size >= self.threshold
+
+    async def submit(self, func, *args):
+        """Return func(*args) run in the pool."""
+        self.offloaded += 1
+        return await asyncio.get_running_loop().run_in_executor(self._get_executor(), func, *args)
+
+    async def run(self, func, *args, size=0):
+        """
+        Return func(*args), offloaded if size (bytes of input) reaches the threshold.
+        """
+        if not self.offloads(size):
+            return func(*args)
+        return await self.submit(func, *args)
+
+    def close(self):
+        if self._shared_key is not None:
+            offloader, references = self._shared[self._shared_key]
+            if references > 1:
+                self._shared[self._shared_key] = (offloader, references - 1)
+                return
+            del self._shared[self._shared_key]
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,63 @@
+"""
+On-disk cache of article scores keyed by comment count.
+"""
+import sqlite3
+from time import time
+from logging import getLogger
+from pathlib import Path
+from typing import Optional
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class ScoreCache:
+    """
+    SQLite backed {(site, identifier): (comment_count, score, scored_at)}.
+    A score is reused while the article's comment count is unchanged and the score is younger than ttl.
+    """
+    # Commit after this many writes, so a killed crawl keeps most of its work.
+    commit_every = 100
+
+    def __init__(self, path, ttl: float):
+        """
+        Args:
+            path: SQLite file.
+            ttl: Seconds a score is reused for. 0 to reuse forever.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS score ("
+            "site TEXT NOT NULL, identifier TEXT NOT NULL, comment_count INTEGER NOT NULL, "
+            "score INTEGER NOT NULL, scored_at REAL NOT NULL, PRIMARY KEY (site, identifier))"
+        )
+        self._pending_writes = 0
+        logger.info("Score cache %s opened with TTL %ss", path, ttl)
+
+    def get(self, site, identifier, comment_count) -> Optional[int]:
+        """Return cached score, None if missing, stale or comment count changed."""
+        row = self._conn.execute(
+            "SELECT score, scored_at FROM score WHERE site = ? AND identifier = ? AND comment_count = ?",
+            (site, identifier, comment_count)
+        ).fetchone()
+        if row is None:
+            return None
+        score, scored_at = row
+        if self.ttl and time() - scored_at > self.ttl:
+            return None
+        return score
+
+    def put(self, site, identifier, comment_count, score):
+        self._conn.execute(
+            "INSERT OR REPLACE INTO score VALUES (?, ?, ?, ?, ?)",
+            (site, identifier, comment_count, score, time())
+        )
+        self._pending_writes += 1
+        if self._pending_writes >= self.commit_every:
+            self._conn.commit()
+            self._pending_writes = 0
+
+    def close(self):
+        self._conn.commit()
+        self._conn.close()
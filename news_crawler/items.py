@@ -3,7 +3,7 @@
 # See documentation in:
 # https://docs.scrapy.org/en/latest/topics/items.html
 from abc import ABCMeta
-from typing import Literal
+from typing import Literal, Optional
 from datetime import datetime
 from dataclasses import dataclass
 
@@ -15,9 +15,10 @@ class BaseArticle(metaclass=ABCMeta):
     """
     url: str                    # URL of article
     title: str                  # Article title
-    comment_count: int = 0      # Number of comment on article
+    comment_count: Optional[int] = 0    # Number of comment on article. None if unknown
     score: int = 0              # Article score
     identifier: str = ""        # Identifier used by the news site
+    needs_rescore: bool = False # Score couldn't be calculated this run, keep the stored one
 
 @dataclass(kw_only=True)
 class VnExpressArticle(BaseArticle):
@@ -0,0 +1,59 @@
+# Define here the models for your spider middleware
+#
+# See documentation in:
+# https://docs.scrapy.org/en/latest/topics/spider-middleware.html
+from logging import getLogger
+from urllib.parse import urlsplit
+
+from scrapy.exceptions import NotConfigured
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+def to_replay_url(url, replay_url):
+    """
+    Map a live URL onto the replay server, keeping the original host as first path segment:
+    https://vnexpress.net/category/day?cateid=1 -> http://127.0.0.1:8765/vnexpress.net/category/day?cateid=1
+
+    Args:
+        url: Live URL.
+        replay_url: Base URL of the replay server.
+    """
+    parts = urlsplit(url)
+    query = f"?{parts.query}" if parts.query else ""
+    return f"{replay_url.rstrip('/')}/{parts.netloc}{parts.path or '/'}{query}"
+
+
+class ReplayMiddleware:
+    """
+    Redirect every download to the local replay server (see benchmark/replay.py).
+    Enabled by setting REPLAY_URL.
+    """
+
+    def __init__(self, replay_url):
+        self.replay_url = replay_url
+        logger.info("Replaying requests from %s", self.replay_url)
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        replay_url = crawler.settings.get("REPLAY_URL")
+        if not replay_url:
+            raise NotConfigured
+        return cls(replay_url)
+
+    def process_request(self, request, spider):
+        if "replay_original_url" in request.meta:
+            return None
+        # Returned request is rescheduled, so it must skip the dupefilter.
+        return request.replace(
+            url=to_replay_url(request.url, self.replay_url),
+            dont_filter=True,
+            meta={**request.meta, "replay_original_url": request.url}
+        )
+
+    def process_response(self, request, response, spider):
+        # Restore the live URL so spiders resolve links and item types as usual.
+        original_url = request.meta.get("replay_original_url")
+        if original_url:
+            return response.replace(url=original_url)
+        return response
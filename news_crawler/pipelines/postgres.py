@@ -1,64 +1,183 @@
 import asyncio
+from datetime import datetime, timezone
 from logging import getLogger
+from time import monotonic
 from database.postgres import Postgres
 from scrapy import signals
+from scrapy.settings import BaseSettings
 from itemadapter import ItemAdapter
 
 from database.services.article_service import crawler_db_mapping
+from database.services.unified_service import UnifiedArticleService, retention_cutoff
 from database.schema.base import Base
 
 logger = getLogger(f"scrapy.{__name__}")
 
 class PostgresPipeline:
-    def __init__(self, uri, buffer_limit=100):
-        self.postgres = Postgres(uri=uri)
+    """
+    Upsert articles in buffers. Full buffers are handed to a background writer, so items
+    don't wait for the database unless the writer falls behind by more than queue_size buffers.
+    """
+    def __init__(self, postgres: Postgres, buffer_limit=100, upsert_method=None, flush_interval=30.0, queue_size=2, refresh_rankings=True, sync_unified=False, stats=None, max_write_failures=3, retention_months=0):
+        self.postgres = postgres
         # Bulk insert articles instead of one by one.
         self.article_buffer = []
         # Buffer length. 0 for unlimited. All will be inserted at once at the end.
         self.buffer_limit = buffer_limit
+        # See BasePostgresService.upsert_method. None for the DB service's default.
+        self.upsert_method = upsert_method
+        # Seconds an article may wait in buffer before it's flushed anyway. 0 to only flush on size.
+        self.flush_interval = flush_interval
+        # Full buffers waiting for the writer. process_item waits when it's full.
+        self.flush_queue = asyncio.Queue(maxsize=queue_size)
+        # Monotonic time first article entered current buffer.
+        self._buffer_started = None
+        self._tasks = []
+        # Refresh ranking materialized views once everything is written.
+        self.refresh_rankings = refresh_rankings
+        # Copy this crawl's articles to the cross-site article table once everything is written.
+        self.sync_unified = sync_unified
+        self._opened_at = None
+        self.stats = stats
+        # Buffers failing to be written in a row before the crawl is stopped. 0 to never stop.
+        self.max_write_failures = max_write_failures
+        self._write_failures = 0
+        # Months kept before this one. Older articles aren't synced to the unified table.
+        self.retention_months = retention_months
         logger.debug("PostgresPipeline init buffer limit %d", self.buffer_limit)
 
     @classmethod
     def from_crawler(cls, crawler):
-        pg_settings = crawler.settings.get("POSTGRES_PIPELINE_SETTINGS", {})
-        postgres = cls(pg_settings.get("URI"), pg_settings.get("BUFFER_SIZE", 100))
+        pg_settings = crawler.settings.getdict("POSTGRES_PIPELINE_SETTINGS")
+        # getbool reads "0" and "False" given with -s as False.
+        flags = BaseSettings(pg_settings)
+        postgres = cls(
+            Postgres.from_settings(pg_settings),
+            int(pg_settings.get("BUFFER_SIZE", 100)),
+            pg_settings.get("UPSERT_METHOD"),
+            float(pg_settings.get("FLUSH_INTERVAL", 30)),
+            int(pg_settings.get("QUEUE_SIZE", 2)),
+            flags.getbool("REFRESH_RANKINGS", True),
+            flags.getbool("SYNC_UNIFIED", False),
+            crawler.stats,
+            int(pg_settings.get("MAX_WRITE_FAILURES", 3)),
+            int(pg_settings.get("RETENTION_MONTHS") or 0)
+        )
         crawler.signals.connect(postgres.spider_opened, signal=signals.spider_opened)
         crawler.signals.connect(postgres.spider_closed, signal=signals.spider_closed)
         return postgres
 
     async def spider_opened(self, spider):
+        self._opened_at = datetime.now(timezone.utc)
         await self.postgres.init_db(Base.metadata)
+        self.site = spider.name
+        self.spider = spider
         self.DBService = crawler_db_mapping[spider.name]
+        async with self.postgres.engine.connect() as db_conn:
+            await self.DBService.create_ranking_views(db_conn)
         logger.info(
             "Postgres Pipeline use %s for DB service", self.DBService.__name__
         )
+        self._tasks.append(asyncio.ensure_future(self.write_loop()))
+        if self.flush_interval:
+            self._tasks.append(asyncio.ensure_future(self.flush_loop()))
 
     async def spider_closed(self):
-        await self.upsert_current_to_db()
+        await self.flush_buffer()
+        # Let the writer finish what's queued.
+        await self.flush_queue.join()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self.refresh_rankings:
+            async with self.postgres.engine.connect() as db_conn:
+                await self.DBService.refresh_ranking_views(db_conn)
+        if self.sync_unified:
+            async with self.postgres.engine.connect() as db_conn:
+                await UnifiedArticleService.sync_from_site(
+                    db_conn, self.site, self.DBService, self._opened_at, retention_cutoff(self.retention_months)
+                )
         logger.debug("Done upserting final objects to db.")
         await self.postgres.close_db()
 
     async def process_item(self, item, spider):
+        if not self.article_buffer:
+            self._buffer_started = monotonic()
         self.article_buffer.append(item)
         if self.buffer_limit != 0 and len(self.article_buffer) >= self.buffer_limit:
-            await self.upsert_current_to_db()
+            await self.flush_buffer()
         return item
 
-    async def upsert_current_to_db(self):
+    async def flush_buffer(self):
+        """
+        Swap in an empty buffer and queue the full one for the writer.
+        Wait if the writer is queue_size buffers behind.
+        """
+        if not self.article_buffer:
+            return
+        buffer, self.article_buffer = self.article_buffer, []
+        self._buffer_started = None
+        if self.flush_queue.full():
+            self.inc_stat("postgres/backpressure_wait")
+        await self.flush_queue.put(buffer)
+
+    async def flush_loop(self):
+        """
+        Flush buffer once its oldest article waited flush_interval, so slow crawls still get saved.
+        """
+        while True:
+            await asyncio.sleep(self.flush_interval / 2)
+            started = self._buffer_started
+            if started is not None and monotonic() - started >= self.flush_interval:
+                logger.debug("Flushing %d articles after %.0fs", len(self.article_buffer), self.flush_interval)
+                await self.flush_buffer()
+
+    async def write_loop(self):
+        while True:
+            buffer = await self.flush_queue.get()
+            try:
+                await self.upsert_to_db(buffer)
+            except Exception:
+                # Keep writing later buffers rather than stalling the crawl, unless every one fails.
+                self.inc_stat("postgres/failed_items", len(buffer))
+                logger.exception("Failed to upsert %d items to db", len(buffer))
+                self._write_failures += 1
+                if self.max_write_failures and self._write_failures == self.max_write_failures:
+                    logger.error("%d buffers in a row failed to be written. Closing spider.", self._write_failures)
+                    self.spider.crawler.engine.close_spider(self.spider, "postgres_write_failed")
+            else:
+                self._write_failures = 0
+            finally:
+                self.flush_queue.task_done()
+
+    async def upsert_to_db(self, articles):
         # Do upsert
         dict_list = []
         identifier_set = set()
-        for article in self.article_buffer:
+        now = datetime.now(timezone.utc)
+        for article in articles:
             insert_obj = dict(ItemAdapter(article))
-            # Ignore identifier from news site. Might change.
-            identifier = insert_obj.pop("identifier")
+            # Identifier is stored so the scoring worker can query comment APIs.
+            identifier = insert_obj["identifier"]
+            insert_obj["score_time"] = None if insert_obj["needs_rescore"] else now
             # Prevent duplicate update.
             if not identifier in identifier_set:
                 identifier_set.add(identifier)
                 dict_list.append(insert_obj)
 
+        if not dict_list:
+            return
         async with self.postgres.engine.connect() as db_conn:
-            await self.DBService.bulk_upsert(db_conn, dict_list)
+            await self.DBService.bulk_upsert(db_conn, dict_list, self.upsert_method)
+        self.inc_stat("postgres/upserted", len(dict_list))
+        self.spider.articles_stored(dict_list)
+        if self.stats is not None:
+            pool_status = self.postgres.pool_status()
+            for metric in ("checkedout", "overflow"):
+                if metric in pool_status:
+                    self.stats.max_value(f"postgres/pool_{metric}_max", pool_status[metric])
         logger.info("Upserted %d items to db", len(dict_list))
-        # Reset buffer
-        self.article_buffer = []
+
+    def inc_stat(self, key, count=1):
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
@@ -0,0 +1,51 @@
+"""Fail fast on comment API endpoints that keep failing."""
+from logging import getLogger
+from time import monotonic
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of sending a request to an endpoint whose circuit is open."""
+
+
+class CircuitBreaker:
+    """
+    Open after `failure_threshold` consecutive failures, rejecting calls for `reset_timeout`
+    seconds. Then let calls through again (half-open): one success closes the circuit,
+    one failure opens it for another `reset_timeout`.
+    """
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=30.0):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+
+    @property
+    def is_open(self):
+        return self._opened_at is not None and monotonic() - self._opened_at < self.reset_timeout
+
+    def check(self):
+        if self.is_open:
+            raise CircuitOpenError(f"Circuit for {self.name} is open")
+
+    def record_success(self):
+        if self._opened_at is not None:
+            logger.info("Circuit for %s closed", self.name)
+        self._failures = 0
+        self._opened_at = None
+
+    def record_failure(self):
+        self._failures += 1
+        if self.is_open:
+            # Calls sent before the circuit opened.
+            return
+        half_open = self._opened_at is not None
+        if half_open or self._failures >= self.failure_threshold:
+            self._opened_at = monotonic()
+            logger.warning(
+                "Circuit for %s opened after %d failures. Failing fast for %.0fs",
+                self.name, self._failures, self.reset_timeout
+            )
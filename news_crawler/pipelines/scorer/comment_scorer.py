@@ -1,43 +1,151 @@
 """Populate article item with scores."""
 import asyncio
+import random
 from abc import ABC, abstractmethod
 from logging import getLogger
-from aiohttp import ClientSession, DummyCookieJar
+from time import time
+from urllib.parse import urlencode, urlsplit
+from aiohttp import ClientError, ClientResponseError, ClientSession, ClientTimeout, DummyCookieJar, TCPConnector
 from scrapy import signals
+from scrapy.settings import BaseSettings
 from itemadapter import ItemAdapter
 
+from news_crawler.middlewares import to_replay_url
+from news_crawler.helper.score_cache import ScoreCache
+from news_crawler.helper.http_cache import EndpointTTLs, ResponseCache, conditional_headers
+from news_crawler.helper.offload import Offloader
+from news_crawler.helper import json_backend
+from .scheduler import RequestScheduler
+from .circuit_breaker import CircuitBreaker, CircuitOpenError
+from .fetch_pool import FetchPool
 
 logger = getLogger(f"scrapy.{__name__}")
 
+# Errors leaving an article unscored. It's marked for rescoring instead of dropped.
+SCORING_ERRORS = (ClientError, asyncio.TimeoutError, CircuitOpenError) + json_backend.DECODE_ERRORS
+
 class BaseScorer(ABC):
     """
     Populate article item with scores. Drop item with comment count 0.
     """
     # API to get comment details
     comment_api: str
-    def __init__(self):
+    def __init__(
+        self, stats=None, replay_url=None, score_cache: ScoreCache = None,
+        scheduler: RequestScheduler = None, connections_per_host=8,
+        timeout=10.0, retry_times=2, retry_backoff=0.5, breaker_threshold=5, breaker_reset=30.0,
+        comment_page_size=100, early_stop=False, fetch_workers=16, deferred=False,
+        offloader: Offloader = None, response_cache: ResponseCache = None, cache_ttls: EndpointTTLs = None
+    ):
         if not getattr(self, "comment_api", None):
             raise ValueError(f"Please define the comment API for {type(self).__name__}")
+        self.stats = stats
+        # Every request waits for a slot here.
+        self.scheduler = scheduler or RequestScheduler()
+        self.connections_per_host = connections_per_host
+        # Seconds per request attempt.
+        self.timeout = timeout
+        # Retries after the first attempt, waiting random(0, retry_backoff * 2^attempt) seconds.
+        self.retry_times = retry_times
+        self.retry_backoff = retry_backoff
+        self.breaker_threshold = breaker_threshold
+        self.breaker_reset = breaker_reset
+        # {endpoint: CircuitBreaker}
+        self._breakers = {}
+        # Comments are fetched this many at a time instead of all at once.
+        self.comment_page_size = comment_page_size
+        # Stop fetching like-sorted pages after reaching a comment with zero likes.
+        self.early_stop = early_stop
+        # Follow-up requests (e.g. replies) of all articles in flight go through one pool.
+        self.fetch_pool = FetchPool(fetch_workers)
+        # Leave scoring to the scoring worker instead of scoring in the item pipeline.
+        self.deferred = deferred
+        # Decodes large responses off the reactor thread.
+        self.offloader = offloader or Offloader()
+        # Skip scoring articles whose comment count didn't change. None to always score.
+        self.score_cache = score_cache
+        # Comment API responses kept between runs, for endpoints with a TTL in cache_ttls.
+        # None to always fetch.
+        self.response_cache = response_cache
+        self.cache_ttls = cache_ttls or EndpointTTLs({})
+        # Endpoints are joined onto this. Points to the replay server when benchmarking.
+        self.api_base = self.comment_api
+        if replay_url:
+            self.api_base = to_replay_url(self.comment_api, replay_url).rstrip("/")
 
     def open_spider(self, spider):
+        self.open()
+
+    def open(self):
         # Start asyncio session
-        self._session = ClientSession(base_url=self.comment_api, cookie_jar=DummyCookieJar())
+        connector = TCPConnector(
+            limit=self.scheduler.max_concurrency, limit_per_host=self.connections_per_host
+        )
+        self._session = ClientSession(
+            connector=connector,
+            cookie_jar=DummyCookieJar(),
+            timeout=ClientTimeout(total=self.timeout)
+        )
 
     @classmethod
     def from_crawler(cls, crawler):
-        scorer = cls()
+        scorer = cls.from_settings(crawler.settings, stats=crawler.stats)
         crawler.signals.connect(scorer.spider_closed, signal=signals.spider_closed)
         return scorer
 
+    @classmethod
+    def from_settings(cls, settings, stats=None):
+        """
+        Build scorer from Scrapy settings. Also used by the standalone scoring worker.
+        """
+        scorer_settings = settings.getdict("SCORER_SETTINGS")
+        json_backend.use_backend(settings.get("JSON_BACKEND"))
+        score_cache = None
+        if scorer_settings.get("CACHE_PATH"):
+            score_cache = ScoreCache(
+                scorer_settings["CACHE_PATH"], float(scorer_settings.get("CACHE_TTL", 0))
+            )
+        return cls(
+            stats=stats,
+            replay_url=settings.get("REPLAY_URL"),
+            score_cache=score_cache,
+            scheduler=RequestScheduler.from_settings(settings),
+            connections_per_host=settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"),
+            timeout=float(scorer_settings.get("TIMEOUT", 10)),
+            retry_times=int(scorer_settings.get("RETRY_TIMES", settings.getint("RETRY_TIMES"))),
+            retry_backoff=float(scorer_settings.get("RETRY_BACKOFF", 0.5)),
+            breaker_threshold=int(scorer_settings.get("BREAKER_THRESHOLD", 5)),
+            breaker_reset=float(scorer_settings.get("BREAKER_RESET", 30)),
+            comment_page_size=int(scorer_settings.get("COMMENT_PAGE_SIZE", 100)),
+            early_stop=BaseSettings(scorer_settings).getbool("EARLY_STOP", False),
+            fetch_workers=int(scorer_settings.get("FETCH_WORKERS", settings.getint("CONCURRENT_REQUESTS"))),
+            deferred=scorer_settings.get("MODE", "inline") == "deferred",
+            offloader=Offloader.from_settings(settings),
+            response_cache=ResponseCache.from_settings(settings),
+            cache_ttls=EndpointTTLs(settings.getdict("HTTP_CACHE_SETTINGS").get("TTLS", {}))
+        )
+
     async def spider_closed(self, spider):
+        await self.close()
+
+    async def close(self):
+        await self.fetch_pool.close()
         logger.debug("Comment Async session closed.")
         await self._session.close()
+        if self.score_cache is not None:
+            self.score_cache.close()
+        if self.response_cache is not None:
+            self.response_cache.close()
+        self.offloader.close()
 
     async def process_item(self, item, spider):
         """
         Process article. Drop item with comment count 0.
         """
         adapter = ItemAdapter(item)
+        if adapter["comment_count"] is None:
+            # Count missing, already marked for rescoring with its stored count.
+            return item
         if adapter["comment_count"] <= 0:
             logger.debug(
                 "Article %s (%s) has 0 comment. Auto-skipped.",
@@ -45,19 +153,144 @@ class BaseScorer(ABC):
             )
             return item
 
-        score = await self.calculate_score(adapter)
+        if self.reuse_cached_score(adapter, spider.name):
+            return item
+        if self.deferred:
+            # Stored as is. The scoring worker (news_crawler.score) picks it up from the database.
+            adapter["needs_rescore"] = True
+            self.inc_stat("scorer/deferred")
+            return item
+        await self.score_article(adapter, spider.name)
+        return item
+
+    def reuse_cached_score(self, adapter, site) -> bool:
+        """
+        Set score from cache if comment count is unchanged. Return whether it was.
+        """
+        if self.score_cache is None:
+            return False
+        score = self.score_cache.get(site, adapter["identifier"], adapter["comment_count"])
+        if score is None:
+            self.inc_stat("scorer/cache_miss")
+            return False
         adapter["score"] = score
+        adapter["needs_rescore"] = False
+        self.inc_stat("scorer/cache_hit")
+        logger.debug(
+            "Article %s reused cached score %d (%s)",
+            adapter["identifier"], adapter["score"], adapter["title"]
+        )
+        return True
+
+    async def score_article(self, adapter, site):
+        """
+        Set score of article, or mark it for rescoring if comment APIs fail.
+        """
+        try:
+            score = await self.calculate_score(adapter)
+        except SCORING_ERRORS as error:
+            # Keep whatever score is stored and let a later run score it.
+            adapter["needs_rescore"] = True
+            self.inc_stat("scorer/rescore_marked")
+            logger.warning(
+                "Article %s couldn't be scored, marked for rescoring (%s): %r",
+                adapter["identifier"], adapter["title"], error
+            )
+            return
+        self.inc_stat("scorer/articles_scored")
+        adapter["score"] = score
+        adapter["needs_rescore"] = False
+        if self.score_cache is not None:
+            self.score_cache.put(site, adapter["identifier"], adapter["comment_count"], score)
         logger.debug(
             "Article %s set score to %d (%s)",
             adapter["identifier"], adapter["score"], adapter["title"]
         )
-        return item
 
-    async def fetch_json(self, endpoint, params):
-        async with self._session.get(endpoint, params=params) as response:
-            logger.info("%s GET <%d %s>", self.__class__.__name__, response.status, response.url)
-            response.raise_for_status()
-            return await response.json(content_type=None)
+    def inc_stat(self, key, count=1):
+        # Scorer can run without a crawler, hence without stats.
+        if self.stats is not None:
+            self.stats.inc_value(key, count)
+
+    def _breaker(self, endpoint):
+        if endpoint not in self._breakers:
+            self._breakers[endpoint] = CircuitBreaker(
+                f"{self.api_base}{endpoint}", self.breaker_threshold, self.breaker_reset
+            )
+        return self._breakers[endpoint]
+
+    @staticmethod
+    def is_retryable(error):
+        # Other 4xx won't get better by asking again.
+        if isinstance(error, ClientResponseError):
+            return error.status == 429 or error.status >= 500
+        return True
+
+    async def fetch_json(self, endpoint, params, decode=json_backend.loads):
+        """
+        GET endpoint with retries. Raise CircuitOpenError without sending anything
+        while the endpoint is failing.
+
+        Args:
+            decode: Turn response body into the result. Must be picklable to be offloaded
+                to a process pool, and the same for every call to an endpoint.
+        """
+        breaker = self._breaker(endpoint)
+        attempt = 0
+        while True:
+            breaker.check()
+            try:
+                result = await self._fetch_json_once(endpoint, params, decode)
+            except (ClientError, asyncio.TimeoutError) as error:
+                if not self.is_retryable(error):
+                    # The endpoint answered, e.g. 404 for a deleted article. Only this call is bad.
+                    breaker.record_success()
+                    raise
+                breaker.record_failure()
+                if attempt >= self.retry_times:
+                    raise
+                delay = random.uniform(0, self.retry_backoff * 2 ** attempt)
+                attempt += 1
+                self.inc_stat("scorer/retry_count")
+                logger.debug("Retrying %s in %.2fs (attempt %d): %r", endpoint, delay, attempt, error)
+                await asyncio.sleep(delay)
+            else:
+                breaker.record_success()
+                return result
+
+    async def _fetch_json_once(self, endpoint, params, decode):
+        url = self.api_base + endpoint
+        cache_key = cached = None
+        headers = {}
+        ttl = self.cache_ttls.ttl_for(url) if self.response_cache is not None else None
+        if ttl is not None:
+            cache_key = f"scorer:{url}?{urlencode(sorted(params.items()))}"
+            cached = self.response_cache.get(cache_key)
+            if cached is None:
+                self.inc_stat("scorer/http_cache_miss")
+            elif time() - cached.stored_at < ttl:
+                self.inc_stat("scorer/http_cache_hit")
+                return await self.offloader.run(decode, cached.body, size=len(cached.body))
+            else:
+                headers = conditional_headers(cached.headers)
+        host = urlsplit(url).netloc
+        async with self.scheduler.slot(host):
+            self.inc_stat("scorer/request_count")
+            async with self._session.get(url, params=params, headers=headers) as response:
+                logger.info("%s GET <%d %s>", self.__class__.__name__, response.status, response.url)
+                self.scheduler.report(host, response.status)
+                if cached is not None and response.status == 304:
+                    self.inc_stat("scorer/http_cache_revalidated")
+                    self.response_cache.refresh(cache_key)
+                    body = cached.body
+                else:
+                    response.raise_for_status()
+                    body = await response.read()
+                    if cache_key is not None:
+                        self.response_cache.put(
+                            cache_key, str(response.url), response.status, dict(response.headers), body
+                        )
+        return await self.offloader.run(decode, body, size=len(body))
 
     @abstractmethod
     async def calculate_score(self, adapter) -> int:
@@ -0,0 +1,94 @@
+"""
+Typed comment API responses, holding only the fields scoring needs.
+
+With msgspec installed they're decoded straight from JSON, skipping every other field
+(comment content, user info...). Otherwise JSON is decoded by json_backend and copied over.
+Decoders are module level functions so they can run in a process pool.
+"""
+from dataclasses import dataclass, field
+from typing import Any, Optional
+
+from news_crawler.helper import json_backend
+from news_crawler.helper.json_backend import msgspec
+
+
+@dataclass
+class VnExpressReplys:
+    total: Optional[int] = 0
+
+
+@dataclass
+class VnExpressComment:
+    comment_id: Any = None
+    userlike: Optional[int] = 0
+    replys: Optional[VnExpressReplys] = None
+
+    @property
+    def reply_count(self):
+        return (self.replys.total or 0) if self.replys else 0
+
+
+@dataclass
+class VnExpressCommentList:
+    items: list[VnExpressComment] = field(default_factory=list)
+
+
+@dataclass
+class VnExpressCommentPage:
+    """Response of VnExpress comment list and reply endpoints."""
+    data: VnExpressCommentList = field(default_factory=VnExpressCommentList)
+
+
+@dataclass
+class TuoiTreChildComment:
+    likes: Optional[int] = 0
+
+
+@dataclass
+class TuoiTreComment:
+    likes: Optional[int] = 0
+    child_comments: Optional[list[TuoiTreChildComment]] = None
+
+
+@dataclass
+class TuoiTreCommentPage:
+    """Response of TuoiTre comment list endpoint. Data is a JSON string of comments."""
+    Data: str = "[]"
+
+
+if msgspec is not None:
+    _vnexpress_page_decoder = msgspec.json.Decoder(VnExpressCommentPage)
+    _tuoitre_page_decoder = msgspec.json.Decoder(TuoiTreCommentPage)
+    _tuoitre_comments_decoder = msgspec.json.Decoder(list[TuoiTreComment])
+
+
+def decode_vnexpress_page(body) -> VnExpressCommentPage:
+    if msgspec is not None:
+        return _vnexpress_page_decoder.decode(body)
+    items = json_backend.loads(body).get("data", {}).get("items", [])
+    return VnExpressCommentPage(VnExpressCommentList([
+        VnExpressComment(
+            comment_id=item.get("comment_id"),
+            userlike=item.get("userlike", 0),
+            replys=VnExpressReplys(item["replys"].get("total", 0)) if item.get("replys") else None
+        )
+        for item in items
+    ]))
+
+
+def decode_tuoitre_page(body) -> TuoiTreCommentPage:
+    if msgspec is not None:
+        return _tuoitre_page_decoder.decode(body)
+    return TuoiTreCommentPage(json_backend.loads(body).get("Data", "[]"))
+
+
+def decode_tuoitre_comments(data) -> list[TuoiTreComment]:
+    if msgspec is not None:
+        return _tuoitre_comments_decoder.decode(data)
+    return [
+        TuoiTreComment(
+            likes=comment.get("likes", 0),
+            child_comments=[TuoiTreChildComment(child.get("likes", 0)) for child in comment.get("child_comments") or []]
+        )
+        for comment in json_backend.loads(data)
+    ]
@@ -0,0 +1,51 @@
+"""Bound comment API follow-up requests across articles scored at the same time."""
+import asyncio
+from logging import getLogger
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class FetchPool:
+    """
+    Queue of fetch jobs from every article in flight, consumed by a fixed number of
+    workers, which bounds follow-up requests across articles.
+    """
+
+    def __init__(self, workers=16):
+        self.workers = workers
+        self._queue = asyncio.Queue()
+        self._tasks = []
+
+    def submit(self, coro_func, *args) -> asyncio.Future:
+        """
+        Queue coro_func(*args) and return a future of its result.
+        """
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._work()) for _ in range(self.workers)]
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((future, coro_func, args))
+        return future
+
+    async def _work(self):
+        while True:
+            future, coro_func, args = await self._queue.get()
+            try:
+                result = await coro_func(*args)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            except Exception as error:
+                # Futures cancelled by their waiters take no result.
+                if not future.done():
+                    future.set_exception(error)
+            else:
+                if not future.done():
+                    future.set_result(result)
+            finally:
+                self._queue.task_done()
+
+    async def close(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
@@ -0,0 +1,116 @@
+"""Bound concurrency and rate of comment API requests."""
+import asyncio
+from contextlib import asynccontextmanager
+from logging import getLogger
+from time import monotonic
+
+logger = getLogger(f"scrapy.{__name__}")
+
+
+class TokenBucket:
+    """
+    Allow `rate` acquisitions per second on average, with bursts of up to `burst`.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._updated = monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Lock so waiters are served in order instead of racing for each new token.
+        async with self._lock:
+            while True:
+                now = monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class RequestScheduler:
+    """
+    Gate every scorer request through a global semaphore, a per-host token bucket and
+    a per-host backoff delay that doubles on 429/5xx responses and halves on success.
+    """
+    # Statuses meaning the server wants us to slow down.
+    backoff_statuses = {429, 500, 502, 503, 504}
+
+    def __init__(self, max_concurrency=16, rate=0.0, burst=1, backoff_start=1.0, backoff_max=60.0):
+        """
+        Args:
+            max_concurrency: Requests in flight across all hosts.
+            rate: Requests per second per host. 0 for unlimited.
+            burst: Requests allowed at once when rate limited.
+            backoff_start: First delay in seconds after a throttling response.
+            backoff_max: Upper bound of delay in seconds.
+        """
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst
+        self.backoff_start = backoff_start
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._buckets = {}
+        # {host: current backoff delay}
+        self._backoff = {}
+        # {host: monotonic time requests may resume}
+        self._resume_at = {}
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Derive limits from Scrapy's own settings so the scorer obeys the same politeness
+        as the crawl. SCORER_SETTINGS can override them.
+        """
+        scorer_settings = settings.getdict("SCORER_SETTINGS")
+        download_delay = settings.getfloat("DOWNLOAD_DELAY")
+        rate = float(scorer_settings.get("RATE_LIMIT", 0)) or (1 / download_delay if download_delay else 0)
+        backoff_start, backoff_max = 1.0, 60.0
+        if settings.getbool("AUTOTHROTTLE_ENABLED"):
+            backoff_start = settings.getfloat("AUTOTHROTTLE_START_DELAY")
+            backoff_max = settings.getfloat("AUTOTHROTTLE_MAX_DELAY")
+        return cls(
+            max_concurrency=int(scorer_settings.get("MAX_CONCURRENCY", settings.getint("CONCURRENT_REQUESTS"))),
+            rate=rate,
+            burst=int(scorer_settings.get("RATE_BURST", settings.getint("CONCURRENT_REQUESTS_PER_DOMAIN"))),
+            backoff_start=backoff_start,
+            backoff_max=backoff_max
+        )
+
+    def _bucket(self, host):
+        if host not in self._buckets:
+            self._buckets[host] = TokenBucket(self.rate, self.burst)
+        return self._buckets[host]
+
+    @asynccontextmanager
+    async def slot(self, host):
+        """
+        Wait for permission to send one request to host.
+        """
+        async with self._semaphore:
+            delay = self._resume_at.get(host, 0) - monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if self.rate:
+                await self._bucket(host).acquire()
+            yield
+
+    def report(self, host, status):
+        """
+        Adapt backoff delay of host to a response status.
+        """
+        backoff = self._backoff.get(host, 0)
+        if status in self.backoff_statuses:
+            backoff = min(self.backoff_max, max(self.backoff_start, backoff * 2))
+            self._backoff[host] = backoff
+            self._resume_at[host] = monotonic() + backoff
+            logger.warning("Got %d from %s. Backing off for %.1fs", status, host, backoff)
+        elif backoff:
+            # Recover gradually, dropping the delay once it's under the starting value.
+            backoff /= 2
+            self._backoff[host] = backoff if backoff >= self.backoff_start else 0
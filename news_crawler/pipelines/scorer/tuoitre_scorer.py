@@ -1,7 +1,7 @@
-import json
 import asyncio
 from logging import getLogger
 from .comment_scorer import BaseScorer
+from .comments import decode_tuoitre_page, decode_tuoitre_comments
 
 logger = getLogger(f"scrapy.{__name__}")
 class TuoiTreScorer(BaseScorer):
@@ -11,11 +11,28 @@ class TuoiTreScorer(BaseScorer):
         """
         Calculate score per article.
         """
-        response = await self.get_comments(adapter)
-        score = self.parse_api_response(response)
+        score = 0
+        async for comments in self.iter_comment_pages(adapter):
+            score += self.score_comments(comments)
         return score
 
-    async def get_comments(self, adapter):
+    async def iter_comment_pages(self, adapter):
+        """
+        Yield decoded comment list, comment_page_size comments at a time.
+        Unlike VnExpress, all pages are walked: child comments' likes aren't part of the sort.
+        """
+        page_index = 1
+        fetched = 0
+        while fetched < adapter["comment_count"]:
+            response = await self.get_comments(adapter, page_index, self.comment_page_size)
+            comments = await self.decode_comments(response)
+            yield comments
+            if len(comments) < self.comment_page_size:
+                break
+            fetched += len(comments)
+            page_index += 1
+
+    async def get_comments(self, adapter, page_index, page_size):
         """
         Query for comment details.
         """
@@ -23,23 +40,30 @@ class TuoiTreScorer(BaseScorer):
             "objId": adapter["identifier"],
             "sort": 2,                          # Sort by most like
             "objType": 1,
-            "pageSize": adapter["comment_count"]
+            "pageIndex": page_index,
+            "pageSize": page_size
         }
-        return await self.fetch_json("/api/getlist-comment.api", params=params)
+        return await self.fetch_json("/api/getlist-comment.api", params=params, decode=decode_tuoitre_page)
 
-    def parse_api_response(self, response):
+    async def decode_comments(self, response):
         """
-        Parse response from get comment list API and calculate score.
+        Get comment list from get comment list API response.
         """
         # Data field is a string instead of json.
-        comments = json.loads(response["Data"])
+        data = response.Data
+        return await self.offloader.run(decode_tuoitre_comments, data, size=len(data))
+
+    def score_comments(self, comments):
+        """
+        Calculate sum of likes of comments and their child comments.
+        """
         final = 0
         for comment in comments:
-            for child in comment.get("child_comments", []):
-                final += child.get("likes", 0)
+            for child in comment.child_comments or []:
+                final += child.likes or 0
 
             # No early terminate as I wasn't exactly sure how child comment's like count
             # factor into the sort.
-            likes = comment.get("likes", 0)
+            likes = comment.likes or 0
             final += likes
-        return final
\ No newline at end of file
+        return final
@@ -1,6 +1,7 @@
 import asyncio
 from logging import getLogger
 from .comment_scorer import BaseScorer
+from .comments import decode_vnexpress_page
 
 logger = getLogger(f"scrapy.{__name__}")
 class VnExpressScorer(BaseScorer):
@@ -11,37 +12,58 @@ class VnExpressScorer(BaseScorer):
         Return score of article.
         """
         score = 0
-        response = await self.get_comments(adapter)
-        results = self.parse_api_response(response)
-        score += results["score"]
-
-        # Calculate score from replys to comment
+        # Reply requests start as soon as their parent's page is parsed.
         tasks = []
-        for comment_id, reply_count in results["comment_replys"].items():
-            if reply_count > 0:
-                tasks.append(self.get_comment_replys(
-                    adapter, comment_id, reply_count
-                ))
-        results = await asyncio.gather(*tasks)
+        try:
+            async for response in self.iter_comment_pages(adapter):
+                results = self.parse_api_response(response)
+                score += results["score"]
+
+                # Calculate score from replys to comment
+                for comment_id, reply_count in results["comment_replys"].items():
+                    if reply_count > 0:
+                        tasks.append(self.fetch_pool.submit(self.get_comment_replys, adapter, comment_id, reply_count))
+                # Later pages are sorted below zero likes too. Replies to their comments are skipped.
+                if self.early_stop and results["reached_zero"]:
+                    break
+        finally:
+            # Wait for all, also when paging failed, so no failed reply request goes unretrieved.
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        # Then fail on the first error.
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
         for result in results:
             parsed = self.parse_api_response(result)
             score += parsed["score"]
         return score
 
-    async def get_comments(self, adapter):
+    async def iter_comment_pages(self, adapter):
+        """
+        Yield responses of comment list, comment_page_size comments at a time.
+        """
+        offset = 0
+        while offset < adapter["comment_count"]:
+            response = await self.get_comments(adapter, offset, self.comment_page_size)
+            yield response
+            if len(response.data.items) < self.comment_page_size:
+                break
+            offset += self.comment_page_size
+
+    async def get_comments(self, adapter, offset, limit):
         """
         Query for comment details.
         """
         params = {
-            "offset": 0,
-            "limit": adapter["comment_count"],
+            "offset": offset,
+            "limit": limit,
             "sort": "like",
             "objectid": adapter["article_id"],
             "objecttype": adapter["article_type"],
             "category_id": adapter["category_id"],
             "siteid": 1000000
         }
-        return await self.fetch_json("/index/get", params=params)
+        return await self.fetch_json("/index/get", params=params, decode=decode_vnexpress_page)
 
     async def get_comment_replys(self, adapter, comment_id, reply_count):
         """
@@ -56,24 +78,27 @@ class VnExpressScorer(BaseScorer):
             "id": comment_id,
             "siteid": 1000000,
         }
-        return await self.fetch_json("/index/getreplay", params=params)
+        return await self.fetch_json("/index/getreplay", params=params, decode=decode_vnexpress_page)
 
     def parse_api_response(self, response):
         """
         Parse API response into dict format and calculate sum of all user likes.
         """
-        items = response["data"]["items"]
+        items = response.data.items
         tentative_score = 0
+        reached_zero = False
         for item in items:
             # Early terminate because we already sorted by like count
-            if item.get("userlike", 0) == 0:
+            if not item.userlike:
+                reached_zero = True
                 break
-            tentative_score += item["userlike"]
+            tentative_score += item.userlike
 
         return {
             "score": tentative_score,
+            "reached_zero": reached_zero,
             "comment_replys": {
                 # {comment_id: reply_count}
-                item.get("comment_id"): item.get("replys", {}).get("total", 0) for item in items
+                item.comment_id: item.reply_count for item in items
             }
         }
\ No newline at end of file
@@ -0,0 +1,303 @@
+"""
+Scheduler sharing its requests with other crawl nodes through the frontier table.
+
+Every node started with the same CRAWL_JOB pushes the requests it schedules to the frontier
+and claims requests to download from it, so category shards and listing pages are spread over
+all nodes. Frontier rows are unique per request fingerprint, which makes it the job's dupefilter.
+The first node to open sets the job's crawl window, so every node builds the same requests
+(VnExpress date ranges are in their URLs), and articles one node took are skipped by the others.
+"""
+import asyncio
+import json
+import os
+import socket
+from base64 import b64decode, b64encode
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import Optional
+
+from scrapy import FormRequest, Request
+from scrapy.core.scheduler import BaseScheduler
+from scrapy.http import JsonRequest
+from scrapy.utils.defer import deferred_from_coro
+from scrapy.utils.request import request_from_dict
+
+from database.postgres import Postgres
+from database.schema.base import Base
+from database.services.frontier_service import FrontierService
+from news_crawler.items import BaseArticle, TuoiTreArticle, VnExpressArticle
+
+logger = getLogger(f"scrapy.{__name__}")
+
+# Only these are rebuilt from frontier rows, which any node (or anyone with write access to
+# the table) may have written. Rows are JSON, never pickles.
+REQUEST_CLASSES = {f"{cls.__module__}.{cls.__name__}": cls for cls in (FormRequest, JsonRequest)}
+ARTICLE_CLASSES = {cls.__name__: cls for cls in (VnExpressArticle, TuoiTreArticle)}
+
+
+def _encode(value):
+    """
+    request_to_dict output as JSON types. Bytes, datetimes, non-string keys and articles
+    (comment count requests carry them) are tagged.
+    """
+    if isinstance(value, BaseArticle):
+        return {"__article__": type(value).__name__, "fields": _encode(vars(value))}
+    if isinstance(value, bytes):
+        return {"__bytes__": b64encode(value).decode()}
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    if isinstance(value, dict):
+        if all(isinstance(key, str) for key in value):
+            return {key: _encode(item) for key, item in value.items()}
+        return {"__items__": [[_encode(key), _encode(item)] for key, item in value.items()]}
+    if isinstance(value, (list, tuple)):
+        return [_encode(item) for item in value]
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    raise TypeError(f"Can't share {type(value).__name__} through the frontier")
+
+
+def _decode(obj: dict):
+    if "__bytes__" in obj:
+        return b64decode(obj["__bytes__"])
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    if "__items__" in obj:
+        return {key: item for key, item in obj["__items__"]}
+    if "__article__" in obj:
+        cls = ARTICLE_CLASSES[obj["__article__"]]
+        # Fields are already post-processed, don't run __post_init__ again (TuoiTre prefixes url).
+        article = cls.__new__(cls)
+        vars(article).update(obj["fields"])
+        return article
+    return obj
+
+
+def dump_request(request: Request, spider) -> bytes:
+    return json.dumps(_encode(request.to_dict(spider=spider))).encode()
+
+
+def load_request(data: bytes, spider) -> Request:
+    request_dict = json.loads(data, object_hook=_decode)
+    if request_dict.get("_class", "") not in ("", *REQUEST_CLASSES):
+        raise ValueError(f"Refusing to load request of class {request_dict['_class']}")
+    return request_from_dict(request_dict, spider=spider)
+
+
+class DistributedScheduler(BaseScheduler):
+    """
+    Push scheduled requests to the frontier and claim batches of them in the background.
+    Enabled by SCHEDULER setting, which settings.py sets when CRAWL_JOB is.
+
+    Requests with dont_filter (retries, mostly) stay on the node that made them.
+    A claimed request is acknowledged once the engine is done with it: its response or error
+    handled and follow-ups scheduled, so they're pushed first. Its retries keep it open.
+    The crawl ends on every node once the job has no pending or claimed request left.
+    """
+
+    def __init__(self, crawler, postgres: Postgres, job: str, batch_size=16, poll_interval=1.0, claim_timeout=600.0):
+        self.crawler = crawler
+        self.postgres = postgres
+        self.job = job
+        # Requests claimed at once.
+        self.batch_size = batch_size
+        # Seconds between syncs with the frontier when there's nothing to do.
+        self.poll_interval = poll_interval
+        # Seconds after which requests claimed by a node are given to others, in case it died.
+        self.claim_timeout = claim_timeout
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self.spider = None
+        self.stats = crawler.stats
+        # Claimed requests waiting to be downloaded, and local only ones.
+        self.buffer = deque()
+        # Requests to push: {"fingerprint", "priority", "request"}.
+        self.outgoing = []
+        # Fingerprints this node pushed, to not push them again.
+        self.seen = set()
+        # {frontier id: [requests handed to the engine]}, the claimed request and its retries.
+        self.processing = {}
+        # Pending and claimed requests in the frontier at last sync.
+        self.unfinished = 0
+        # Set when the buffer runs low or a batch is ready to push.
+        self._wake = asyncio.Event()
+        # Set on any scheduled request, waking a node that found nothing to claim.
+        self._scheduled = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        settings = crawler.settings
+        dist_settings = settings.getdict("DISTRIBUTED_SETTINGS")
+        if not dist_settings.get("JOB"):
+            raise ValueError("DistributedScheduler needs DISTRIBUTED_SETTINGS JOB (CRAWL_JOB).")
+        scheduler = cls(
+            crawler,
+            Postgres.from_settings(settings.getdict("POSTGRES_PIPELINE_SETTINGS")),
+            dist_settings["JOB"],
+            int(dist_settings.get("BATCH_SIZE") or settings.getint("CONCURRENT_REQUESTS")),
+            float(dist_settings.get("POLL_INTERVAL", 1)),
+            float(dist_settings.get("CLAIM_TIMEOUT", 600))
+        )
+        return scheduler
+
+    def open(self, spider):
+        self.spider = spider
+        # One queue per spider, so a job name can be reused across sites.
+        self.job = f"{spider.name}:{self.job}"
+        return deferred_from_coro(self._open())
+
+    async def _open(self):
+        await self.postgres.init_db(Base.metadata)
+        # Before start requests are built, they're only consumed once the scheduler is open.
+        async with self.postgres.engine.connect() as db:
+            to_datetime = await FrontierService.pin_window(db, self.job, self.spider.to_datetime)
+        if to_datetime != self.spider.to_datetime:
+            logger.info("Crawling up to %s, as set by the job's first node", to_datetime)
+            self.spider.pin_window(to_datetime)
+        self._task = asyncio.ensure_future(self.sync_loop())
+        logger.info("Crawling job %s as %s", self.job, self.worker)
+
+    def close(self, reason):
+        return deferred_from_coro(self._close(reason))
+
+    async def _close(self, reason):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+        # Claimed requests not downloaded, or not done with, go back to other nodes.
+        processed = self.processed()
+        unsent = {request.meta["frontier_id"] for request in self.buffer if "frontier_id" in request.meta}
+        unsent.update(frontier_id for frontier_id in self.processing if frontier_id not in processed)
+        async with self.postgres.engine.connect() as db:
+            await FrontierService.push(db, self.job, self.outgoing)
+            await FrontierService.mark_done(db, processed)
+            await FrontierService.release(db, list(unsent))
+        logger.info("Closed job %s (%s). Released %d claimed requests.", self.job, reason, len(unsent))
+        await self.postgres.close_db()
+
+    def has_pending_requests(self) -> bool:
+        return bool(self.buffer or self.outgoing or self.processing or self.unfinished)
+
+    def enqueue_request(self, request: Request) -> bool:
+        self.stats.inc_value("scheduler/enqueued", spider=self.spider)
+        if request.dont_filter:
+            self.buffer.append(request)
+            self.stats.inc_value("frontier/local", spider=self.spider)
+            return True
+        fingerprint = self.crawler.request_fingerprinter.fingerprint(request).hex()
+        if fingerprint in self.seen:
+            self.stats.inc_value("frontier/filtered", spider=self.spider)
+            return False
+        try:
+            data = dump_request(request, self.spider)
+        except TypeError as error:
+            logger.warning("Crawling %s on this node only: %s", request, error)
+            self.buffer.append(request)
+            self.stats.inc_value("frontier/local", spider=self.spider)
+            return True
+        self.seen.add(fingerprint)
+        self._scheduled.set()
+        self.outgoing.append({"fingerprint": fingerprint, "priority": request.priority, "request": data})
+        if len(self.outgoing) >= self.batch_size:
+            self._wake.set()
+        return True
+
+    def next_request(self) -> Optional[Request]:
+        if len(self.buffer) <= self.batch_size // 2:
+            self._wake.set()
+        if not self.buffer:
+            return None
+        request = self.buffer.popleft()
+        self.stats.inc_value("scheduler/dequeued", spider=self.spider)
+        frontier_id = request.meta.get("frontier_id")
+        if frontier_id is not None:
+            # The engine starts downloading it right away, adding it to its in progress requests.
+            self.processing.setdefault(frontier_id, []).append(request)
+        return request
+
+    def processed(self) -> list[int]:
+        """
+        Frontier ids of claimed requests the engine is done with. The engine keeps a request
+        in progress until its response or error went through the spider, which schedules its
+        follow-ups, so those are in outgoing by then.
+        """
+        slot = self.crawler.engine.slot
+        in_progress = slot.inprogress if slot is not None else set()
+        # Retries of a claimed request carry its frontier id.
+        buffered = {request.meta.get("frontier_id") for request in self.buffer}
+        return [
+            frontier_id for frontier_id, requests in self.processing.items()
+            if frontier_id not in buffered and not any(request in in_progress for request in requests)
+        ]
+
+    async def add_seen(self, keys: list[str]) -> set[str]:
+        """
+        Of articles new to this node, those no other node took. See BaseCrawler.drop_seen_by_job.
+        """
+        async with self.postgres.engine.connect() as db:
+            return await FrontierService.add_seen(db, self.job, self.worker, keys)
+
+    async def sync_loop(self):
+        while True:
+            # Cleared before syncing, so requests scheduled during it aren't missed.
+            self._wake.clear()
+            self._scheduled.clear()
+            try:
+                claimed = await self.sync()
+            except Exception:
+                logger.exception("Failed to sync with frontier of job %s", self.job)
+                claimed = 0
+            if claimed and self.crawler.engine.slot is not None:
+                # Don't wait for the engine's heartbeat to start downloading them.
+                self.crawler.engine.slot.nextcall.schedule()
+            # With nothing to claim, only come back early for requests this node scheduled,
+            # not for the engine asking for more.
+            event = self._wake if claimed else self._scheduled
+            try:
+                await asyncio.wait_for(event.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def sync(self) -> int:
+        """
+        Push scheduled requests, acknowledge processed ones and claim more. Return number claimed.
+        """
+        # Before taking outgoing, which then holds their follow-ups. Pushed in the same sync,
+        # so other nodes never see the job finished in between.
+        processed = self.processed()
+        outgoing, self.outgoing = self.outgoing, []
+        async with self.postgres.engine.connect() as db:
+            try:
+                added = await FrontierService.push(db, self.job, outgoing)
+                await FrontierService.mark_done(db, processed)
+            except Exception:
+                # Both are idempotent, so retry everything next sync.
+                self.outgoing[:0] = outgoing
+                raise
+            for frontier_id in processed:
+                del self.processing[frontier_id]
+            self.stats.inc_value("frontier/pushed", added, spider=self.spider)
+            self.stats.inc_value("frontier/filtered", len(outgoing) - added, spider=self.spider)
+            requeued = await FrontierService.requeue_stale(
+                db, self.job, datetime.now(timezone.utc) - timedelta(seconds=self.claim_timeout)
+            )
+            if requeued:
+                logger.warning("Requeued %d requests claimed over %.0fs ago", requeued, self.claim_timeout)
+                self.stats.inc_value("frontier/requeued", requeued, spider=self.spider)
+            rows = []
+            if len(self.buffer) < self.batch_size:
+                rows = await FrontierService.claim(db, self.job, self.worker, self.batch_size - len(self.buffer))
+            for frontier_id, data in rows:
+                try:
+                    request = load_request(data, self.spider)
+                except (ValueError, KeyError, TypeError, AttributeError):
+                    # Not written by a node of this crawler. Don't claim it again.
+                    logger.exception("Skipped unreadable frontier request %d", frontier_id)
+                    await FrontierService.mark_done(db, [frontier_id])
+                    continue
+                request.meta["frontier_id"] = frontier_id
+                self.buffer.append(request)
+            self.stats.inc_value("frontier/claimed", len(rows), spider=self.spider)
+            self.unfinished = await FrontierService.count_unfinished(db, self.job)
+        return len(rows)
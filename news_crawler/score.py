@@ -0,0 +1,160 @@
+"""
+Scoring stage decoupled from crawling. Pull articles that need scoring from the database
+in batches and score them with its own concurrency budget.
+
+Run it next to crawls started with SCORER_MODE=deferred:
+    python -m news_crawler.score (vnexpress|tuoitre) [--once]
+"""
+import asyncio
+import os
+import socket
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from logging import getLogger
+from typing import Optional
+
+from scrapy.utils.log import configure_logging
+from scrapy.utils.project import get_project_settings
+
+from database.postgres import Postgres
+from database.schema.base import Base
+from database.services.article_service import crawler_db_mapping
+from news_crawler.pipelines import VnExpressScorer, TuoiTreScorer
+
+logger = getLogger(f"scrapy.{__name__}")
+
+# Mapping spider name to scorer to use.
+crawler_scorer_mapping = {
+    "vnexpress": VnExpressScorer,
+    "tuoitre": TuoiTreScorer
+}
+
+
+class ScoringWorker:
+    """
+    Score articles marked needs_rescore (and those scored longer than stale_after ago).
+    Several workers can run against one database: each claims its batches, and claims of
+    a worker that stopped responding go to others after claim_timeout seconds.
+    """
+
+    def __init__(
+        self, postgres: Postgres, site: str, scorer, batch_size=50, concurrency=16,
+        stale_after: Optional[timedelta] = None, poll_interval=10.0, claim_timeout=600.0
+    ):
+        self.postgres = postgres
+        self.site = site
+        self.DBService = crawler_db_mapping[site]
+        self.scorer = scorer
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.stale_after = stale_after
+        self.poll_interval = poll_interval
+        self.claim_timeout = claim_timeout
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+
+    async def score_batch(self) -> tuple[int, int]:
+        """
+        Claim, score and save one batch. Claiming and saving are short transactions of their
+        own, no database connection is held while comment APIs are queried.
+
+        Return:
+            (articles claimed, articles scored)
+        """
+        now = datetime.now(timezone.utc)
+        stale_before = None
+        if self.stale_after is not None:
+            stale_before = now - self.stale_after
+        claimed_before = now - timedelta(seconds=self.claim_timeout)
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def score(adapter):
+            # Only changed scores are recorded in score history.
+            adapter["previous_score"] = adapter["score"]
+            async with semaphore:
+                if not self.scorer.reuse_cached_score(adapter, self.site):
+                    await self.scorer.score_article(adapter, self.site)
+            return adapter
+
+        async with self.postgres.engine.connect() as db_conn:
+            rows = await self.DBService.claim_rescore_batch(
+                db_conn, self.worker, self.batch_size, stale_before, claimed_before
+            )
+        if not rows:
+            return 0, 0
+        adapters = await asyncio.gather(*(score(dict(row._mapping)) for row in rows))
+        async with self.postgres.engine.connect() as db_conn:
+            await self.DBService.bulk_update_scores(db_conn, adapters, self.worker)
+        scored = sum(not adapter["needs_rescore"] for adapter in adapters)
+        logger.info("Scored %d/%d %s articles", scored, len(adapters), self.site)
+        return len(adapters), scored
+
+    async def run(self, once=False):
+        """
+        Score batches until cancelled. With once, return as soon as a batch scores nothing.
+        """
+        while True:
+            claimed, scored = await self.score_batch()
+            if scored == 0:
+                # Nothing left, or every claimed article failed: give comment APIs some time.
+                if once:
+                    return
+                await asyncio.sleep(self.poll_interval)
+
+    @classmethod
+    def from_settings(cls, settings, site, stats=None, **kwargs):
+        """
+        Build worker with its own database engine and scorer from Scrapy settings.
+        """
+        pg_settings = settings.getdict("POSTGRES_PIPELINE_SETTINGS")
+        worker_settings = settings.getdict("SCORING_WORKER_SETTINGS")
+        stale_hours = float(worker_settings.get("STALE_HOURS", 0))
+        options = {
+            "batch_size": int(worker_settings.get("BATCH_SIZE", 50)),
+            "concurrency": int(worker_settings.get("CONCURRENCY", 16)),
+            "stale_after": timedelta(hours=stale_hours) if stale_hours else None,
+            "poll_interval": float(worker_settings.get("POLL_INTERVAL", 10)),
+            "claim_timeout": float(worker_settings.get("CLAIM_TIMEOUT", 600)),
+        }
+        options.update(kwargs)
+        scorer = crawler_scorer_mapping[site].from_settings(settings, stats=stats)
+        # Shares the pipeline's engine when running in the crawl process.
+        return cls(Postgres.from_settings(pg_settings), site, scorer, **options)
+
+    async def open(self, init_db=True):
+        if init_db:
+            await self.postgres.init_db(Base.metadata)
+        self.scorer.open()
+
+    async def close(self):
+        await self.scorer.close()
+        await self.postgres.close_db()
+
+
+async def main():
+    parser = ArgumentParser(prog="news_crawler.score", description="Score stored articles.")
+    parser.add_argument("SITENAME", help="Select database to score (vnexpress|tuoitre)")
+    parser.add_argument("--batch-size", type=int, help="Articles claimed per batch.")
+    parser.add_argument("--concurrency", type=int, help="Articles scored at once.")
+    parser.add_argument("--stale-hours", type=float, help="Also rescore articles scored longer ago than this.")
+    parser.add_argument("--once", action="store_true", help="Exit when nothing is left to score.")
+    args = parser.parse_args()
+
+    settings = get_project_settings()
+    configure_logging(settings)
+    overrides = {}
+    if args.batch_size:
+        overrides["batch_size"] = args.batch_size
+    if args.concurrency:
+        overrides["concurrency"] = args.concurrency
+    if args.stale_hours:
+        overrides["stale_after"] = timedelta(hours=args.stale_hours)
+    worker = ScoringWorker.from_settings(settings, args.SITENAME, **overrides)
+    await worker.open()
+    try:
+        await worker.run(once=args.once)
+    finally:
+        await worker.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
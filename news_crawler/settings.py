@@ -51,21 +51,27 @@ COOKIES_DEBUG = True
 
 # Enable or disable spider middlewares
 # See https://docs.scrapy.org/en/latest/topics/spider-middleware.html
-#SPIDER_MIDDLEWARES = {
-#    "vnexpress.middlewares.VnexpressSpiderMiddleware": 543,
-#}
+SPIDER_MIDDLEWARES = {
+    # Only enabled when BENCHMARK_REPORT is set.
+    "benchmark.stats.BenchmarkStats": 50,
+}
 
 # Enable or disable downloader middlewares
 # See https://docs.scrapy.org/en/latest/topics/downloader-middleware.html
-#DOWNLOADER_MIDDLEWARES = {
-#    "vnexpress.middlewares.VnexpressDownloaderMiddleware": 543,
-#}
+DOWNLOADER_MIDDLEWARES = {
+    # Only enabled when REPLAY_URL is set.
+    "news_crawler.middlewares.ReplayMiddleware": 50,
+    # Refreshes the TTL of revalidated responses, see HTTP_CACHE_SETTINGS.
+    "scrapy.downloadermiddlewares.httpcache.HttpCacheMiddleware": None,
+    "news_crawler.helper.http_cache.RevalidatingCacheMiddleware": 900,
+}
 
 # Enable or disable extensions
 # See https://docs.scrapy.org/en/latest/topics/extensions.html
-#EXTENSIONS = {
-#    "scrapy.extensions.telnet.TelnetConsole": None,
-#}
+EXTENSIONS = {
+    # Only enabled with SCORER_SETTINGS MODE deferred and SCORING_WORKER_SETTINGS IN_PROCESS.
+    "news_crawler.extensions.ScoringStage": 500,
+}
 
 # Configure item pipelines
 # See https://docs.scrapy.org/en/latest/topics/item-pipeline.html
@@ -95,11 +101,53 @@ COOKIES_DEBUG = True
 #HTTPCACHE_IGNORE_HTTP_CODES = []
 #HTTPCACHE_STORAGE = "scrapy.extensions.httpcache.FilesystemCacheStorage"
 
+# Persistent HTTP cache (news_crawler.helper.http_cache) shared by Scrapy and the comment scorers.
+HTTP_CACHE_SETTINGS = {
+    "ENABLED": environ.get("HTTP_CACHE", "") not in ("", "0", "false"),
+    # SQLite file holding cached responses.
+    "PATH": environ.get("HTTP_CACHE_PATH", ".crawl_state/http_cache.sqlite"),
+    # Least recently used responses are evicted past this size.
+    "MAX_MB": environ.get("HTTP_CACHE_MAX_MB", 512),
+    # {URL regex: seconds} responses of comment APIs are reused before being revalidated.
+    # Other responses follow their caching headers.
+    "TTLS": {
+        r"usi-saas\.vnexpress\.net/widget/index": 10 * 60,
+        r"id\.tuoitre\.vn/api/getcount-comment": 10 * 60,
+        r"usi-saas\.vnexpress\.net/index/get": 60 * 60,
+        r"id\.tuoitre\.vn/api/getlist-comment": 60 * 60,
+    },
+}
+HTTPCACHE_ENABLED = HTTP_CACHE_SETTINGS["ENABLED"]
+HTTPCACHE_STORAGE = "news_crawler.helper.http_cache.SqliteCacheStorage"
+HTTPCACHE_POLICY = "news_crawler.helper.http_cache.EndpointTTLPolicy"
+
 # Set settings whose default value is deprecated to a future-proof value
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
+# Extract listing pages with precompiled XPath (news_crawler.helper.listing_parser).
+# False to use the spiders' CSS selectors, e.g. to compare with benchmark/parse_bench.py.
+FAST_EXTRACTION = True
+
+# JSON decoder: "orjson", "msgspec", "json", or "auto" for the fastest installed.
+JSON_BACKEND = environ.get("JSON_BACKEND", "auto")
+
+# Parse responses at least THRESHOLD bytes large in a pool, keeping the reactor thread free.
+OFFLOAD_SETTINGS = {
+    # "off", "thread" or "process".
+    "MODE": environ.get("OFFLOAD_MODE", "off"),
+    # Pool size. 0 for one per CPU.
+    "WORKERS": environ.get("OFFLOAD_WORKERS", 0),
+    "THRESHOLD": 256 * 1024,
+}
+
+# Offline replay benchmark (see benchmark/run.py). Both unset for normal crawls.
+# Base URL of the replay server every request is redirected to.
+REPLAY_URL = environ.get("REPLAY_URL")
+# Path to write the benchmark JSON report to.
+BENCHMARK_REPORT = environ.get("BENCHMARK_REPORT")
+
 # Postgres Database settings
 POSTGRES_PIPELINE_SETTINGS = {
     "URI": environ.get(
@@ -111,5 +159,137 @@ POSTGRES_PIPELINE_SETTINGS = {
             environ.get("POSTGRES_DB", "postgres")
         )
     ),
-    "BUFFER_SIZE": environ.get("BUFFER_SIZE", 100)
-}
\ No newline at end of file
+    "BUFFER_SIZE": environ.get("BUFFER_SIZE", 100),
+    # Seconds an article may wait in buffer before it's flushed anyway. 0 to only flush on size.
+    "FLUSH_INTERVAL": environ.get("FLUSH_INTERVAL", 30),
+    # Full buffers waiting to be written before items have to wait for the database.
+    "QUEUE_SIZE": 2,
+    # Buffers failing to be written in a row before the crawl closes with reason
+    # "postgres_write_failed". 0 to keep crawling.
+    "MAX_WRITE_FAILURES": 3,
+    # Refresh the top articles per category materialized views when a crawl ends.
+    "REFRESH_RANKINGS": True,
+    # Copy each crawl's articles to the cross-site, month partitioned article table when it ends.
+    "SYNC_UNIFIED": environ.get("SYNC_UNIFIED", "") not in ("", "0", "false"),
+    # Months kept before this one by `python unified.py retention`, in the site tables and the
+    # unified table. Older articles aren't synced to the unified table. 0 to keep everything.
+    "RETENTION_MONTHS": environ.get("RETENTION_MONTHS", 0),
+    # Connection pool, shared by the pipeline, the in-process scoring worker and read_result.py.
+    "POOL_SIZE": environ.get("POSTGRES_POOL_SIZE", 5),
+    "MAX_OVERFLOW": environ.get("POSTGRES_MAX_OVERFLOW", 10),
+    "POOL_PRE_PING": environ.get("POSTGRES_POOL_PRE_PING", "") not in ("", "0", "false"),
+    # "POOL_RECYCLE": 3600,
+    # Prepared statements cached per connection.
+    "STATEMENT_CACHE_SIZE": 100,
+    # Set when connecting through PgBouncer in transaction pooling mode.
+    "PGBOUNCER": environ.get("POSTGRES_PGBOUNCER", "") not in ("", "0", "false"),
+    # "values" (INSERT ... VALUES), "copy" (binary COPY into a staging table, Postgres only)
+    # or "executemany" (one reused prepared statement for every row).
+    # Unset to use each DB service's default. Use "copy" with large buffers.
+    "UPSERT_METHOD": environ.get("UPSERT_METHOD"),
+}
+
+# Incremental crawling (-a incremental=1) settings
+CRAWL_STATE_SETTINGS = {
+    # Directory to keep one crawl state file per spider in.
+    "DIR": environ.get("CRAWL_STATE_DIR", ".crawl_state"),
+    # Days before the last high-water mark crawled again to refresh comment counts.
+    "REFRESH_DAYS": environ.get("CRAWL_STATE_REFRESH_DAYS", 2)
+}
+
+# Drop articles already seen this crawl, e.g. listed in several categories, before their
+# comment counts are requested.
+DEDUP_SETTINGS = {
+    # "set" (exact), "bloom" (fixed memory, ERROR_RATE of new articles dropped) or "off".
+    "MODE": environ.get("DEDUP_MODE", "set"),
+    # Articles a Bloom filter is sized for.
+    "CAPACITY": 1_000_000,
+    "ERROR_RATE": 0.001,
+    # Also skip articles the database has scores from within this many hours. 0 to not.
+    "SEED_HOURS": environ.get("DEDUP_SEED_HOURS", 0),
+}
+
+# Request comment counts of articles from several listing pages at once.
+COMMENT_COUNT_BATCH_SETTINGS = {
+    # Articles per comment count request. 0 for one request per listing page.
+    "MAX_IDS": environ.get("COMMENT_COUNT_BATCH_SIZE", 100),
+    "MAX_URL_LENGTH": 2000,
+    # Seconds a partial batch waits for more articles before it's sent anyway.
+    "MAX_WAIT": 1,
+}
+
+# VnExpress categories, discovered from the site's navigation bar.
+CATEGORY_INDEX_SETTINGS = {
+    # JSON file caching discovered categories. Empty to crawl the spider's built-in list.
+    "PATH": environ.get("CATEGORY_INDEX_PATH", ".crawl_state/vnexpress_categories.json"),
+    # Hours before categories are discovered again.
+    "TTL_HOURS": 24,
+    # Days a category a finished crawl found empty is skipped. 0 to always crawl it.
+    "EMPTY_SKIP_DAYS": 7,
+}
+
+# Distributed crawling. Nodes started with the same CRAWL_JOB share one request queue
+# (frontier table in the Postgres database) and dupefilter. Use a new job name per crawl.
+DISTRIBUTED_SETTINGS = {
+    "JOB": environ.get("CRAWL_JOB"),
+    # Requests claimed from the frontier at once. Default to CONCURRENT_REQUESTS.
+    "BATCH_SIZE": environ.get("CRAWL_JOB_BATCH_SIZE"),
+    # Seconds between checks for new requests when there's nothing to claim.
+    "POLL_INTERVAL": 1,
+    # Seconds before requests claimed by a node that stopped responding go to other nodes.
+    "CLAIM_TIMEOUT": 600,
+}
+if DISTRIBUTED_SETTINGS["JOB"]:
+    SCHEDULER = "news_crawler.scheduler.DistributedScheduler"
+
+# Comment scorer settings
+SCORER_SETTINGS = {
+    # "inline" scores in the item pipeline. "deferred" stores articles unscored for the
+    # scoring worker: python -m news_crawler.score SITENAME
+    "MODE": environ.get("SCORER_MODE", "inline"),
+    # SQLite file caching scores by article comment count. Empty to always score.
+    "CACHE_PATH": environ.get("SCORER_CACHE_PATH", ".crawl_state/score_cache.sqlite"),
+    # Seconds a cached score is reused while comment count is unchanged. 0 for no expiry.
+    "CACHE_TTL": environ.get("SCORER_CACHE_TTL", 24 * 60 * 60),
+    # Requests in flight across comment APIs. Default to CONCURRENT_REQUESTS.
+    #"MAX_CONCURRENCY": 16,
+    # Requests per second per comment API host. Default to 1 / DOWNLOAD_DELAY, unlimited without delay.
+    #"RATE_LIMIT": 10,
+    # Requests let through at once when rate limited. Default to CONCURRENT_REQUESTS_PER_DOMAIN.
+    #"RATE_BURST": 8,
+    # Backoff on 429/5xx starts at AUTOTHROTTLE_START_DELAY, capped by AUTOTHROTTLE_MAX_DELAY,
+    # when AutoThrottle is enabled. 1s and 60s otherwise.
+    # Seconds per comment API request attempt.
+    "TIMEOUT": environ.get("SCORER_TIMEOUT", 10),
+    # Retries per request. Default to RETRY_TIMES.
+    #"RETRY_TIMES": 2,
+    # Retry n waits a random delay between 0 and RETRY_BACKOFF * 2^n seconds.
+    "RETRY_BACKOFF": 0.5,
+    # Consecutive failures after which an endpoint fails fast for BREAKER_RESET seconds.
+    "BREAKER_THRESHOLD": 5,
+    "BREAKER_RESET": 30,
+    # Comments per comment list request.
+    "COMMENT_PAGE_SIZE": environ.get("SCORER_COMMENT_PAGE_SIZE", 100),
+    # Stop paging like-sorted comments once one has zero likes (VnExpress only). Saves the
+    # comment list requests past that page, but replies to comments on those pages aren't
+    # fetched either, so scores come out lower than a full count when they have liked replies.
+    "EARLY_STOP": environ.get("SCORER_EARLY_STOP", "") not in ("", "0", "false"),
+    # Workers sending reply requests queued by all articles being scored. Default to CONCURRENT_REQUESTS.
+    #"FETCH_WORKERS": 16,
+}
+
+# Scoring worker (python -m news_crawler.score) settings
+SCORING_WORKER_SETTINGS = {
+    # Run the worker inside the crawl process instead of as its own process.
+    "IN_PROCESS": environ.get("SCORING_WORKER_IN_PROCESS", "") not in ("", "0", "false"),
+    # Articles claimed from the database per batch.
+    "BATCH_SIZE": environ.get("SCORING_WORKER_BATCH_SIZE", 50),
+    # Articles scored at once.
+    "CONCURRENCY": environ.get("SCORING_WORKER_CONCURRENCY", 16),
+    # Also rescore articles scored more than this many hours ago. 0 to only score unscored ones.
+    "STALE_HOURS": environ.get("SCORING_WORKER_STALE_HOURS", 0),
+    # Seconds to wait when there's nothing to score.
+    "POLL_INTERVAL": 10,
+    # Seconds before articles claimed by a worker that stopped responding go to other workers.
+    "CLAIM_TIMEOUT": 600,
+}
@@ -1,24 +1,54 @@
 
+import asyncio
 from abc import ABCMeta, abstractmethod
 from datetime import datetime, timedelta, timezone
 
-from scrapy import Request
+from pathlib import Path
+
+from scrapy import Request, signals
+from scrapy.exceptions import DontCloseSpider
 from scrapy.spiders import CrawlSpider
+from sqlalchemy.exc import DBAPIError
 
-from news_crawler.helper.comment_counter import BaseCounter
+from database.postgres import Postgres
+from database.services.article_service import crawler_db_mapping
+from news_crawler.helper.comment_counter import BaseCounter, CommentCountBatcher
+from news_crawler.helper.crawl_state import CrawlState
+from news_crawler.helper.dedup import make_seen
+from news_crawler.helper.listing_parser import ListingParser
+from news_crawler.helper.offload import Offloader
 
 
 class BaseCrawler(CrawlSpider, metaclass=ABCMeta):
     comment_counter: BaseCounter
+    # Extract listing pages with precompiled XPath instead of CSS selectors. FAST_EXTRACTION setting.
+    fast_extraction = True
+    # Parses large pages off the reactor thread when OFFLOAD_SETTINGS enables it. Inline by default.
+    offloader = Offloader()
+    # Identifiers of articles seen this crawl (news_crawler.helper.dedup). None to keep duplicates.
+    seen_articles = None
+    # Batches comment counts of several listing pages when COMMENT_COUNT_BATCH_SETTINGS enables it.
+    count_batcher = None
+    # Crawling with other nodes (DISTRIBUTED_SETTINGS JOB). Seen articles are shared through the scheduler.
+    distributed = False
 
-    def __init__(self, *args, days_ago: int = 30, **kwargs):
+    def __init__(self, *args, days_ago: int = 30, to_timestamp=None, incremental=False, **kwargs):
         """
         Init BaseCrawler.
 
         Args:
             days_ago: Scrapy should crawl articles from how long ago.
+            to_timestamp: Unix timestamp to crawl up to. Default to now.
+                Pinned by the replay benchmark so recorded requests match.
+            incremental: Only crawl what's new since the last finished run,
+                and skip articles whose comment count hasn't changed.
         """
         super().__init__(*args, **kwargs)
+        self.incremental = str(incremental).lower() in ("1", "true", "yes")
+        # Loaded in from_crawler when incremental.
+        self.crawl_state = None
+        # Set on spider_closed. Crawl state is only saved after a finished crawl.
+        self.close_reason = None
 
         # Arguments passed in from command line will be parsed as string. Convert to int.
         if not isinstance(days_ago, int):
@@ -28,6 +58,8 @@ class BaseCrawler(CrawlSpider, metaclass=ABCMeta):
             days_ago = int(days_ago)
 
         self.to_datetime = datetime.now(timezone.utc)
+        if to_timestamp is not None:
+            self.to_datetime = datetime.fromtimestamp(int(to_timestamp), timezone.utc)
         self.from_datetime = self.to_datetime - timedelta(days=days_ago)
 
         self.logger.debug(
@@ -39,7 +71,123 @@ class BaseCrawler(CrawlSpider, metaclass=ABCMeta):
         if not getattr(self, "comment_counter", None):
             raise ValueError(f"Please define a valid CommentParser for {type(self).__name__}")
 
-    def parse_start_url(self, response, **kwargs):
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.fast_extraction = crawler.settings.getbool("FAST_EXTRACTION", True)
+        spider.offloader = Offloader.from_settings(crawler.settings)
+        crawler.signals.connect(spider.offloader.close, signal=signals.spider_closed)
+        dedup_settings = crawler.settings.getdict("DEDUP_SETTINGS")
+        spider.seen_articles = make_seen(
+            dedup_settings.get("MODE", "set"),
+            int(dedup_settings.get("CAPACITY", 1_000_000)),
+            float(dedup_settings.get("ERROR_RATE", 0.001))
+        )
+        seed_hours = float(dedup_settings.get("SEED_HOURS") or 0)
+        if spider.seen_articles is not None and seed_hours:
+            spider.seed_window = timedelta(hours=seed_hours)
+            crawler.signals.connect(spider.seed_seen_articles, signal=signals.spider_opened)
+        batch_settings = crawler.settings.getdict("COMMENT_COUNT_BATCH_SETTINGS")
+        if int(batch_settings.get("MAX_IDS") or 0) > 1:
+            spider.count_batcher = CommentCountBatcher(
+                spider.comment_counter,
+                spider.comment_count_request,
+                int(batch_settings["MAX_IDS"]),
+                int(batch_settings.get("MAX_URL_LENGTH", 2000)),
+                float(batch_settings.get("MAX_WAIT", 1))
+            )
+            crawler.signals.connect(spider.start_count_flusher, signal=signals.spider_opened)
+            crawler.signals.connect(spider.flush_comment_counts_on_idle, signal=signals.spider_idle)
+            crawler.signals.connect(spider.stop_count_flusher, signal=signals.spider_closed)
+        spider.distributed = bool(crawler.settings.getdict("DISTRIBUTED_SETTINGS").get("JOB"))
+        if spider.incremental and spider.distributed:
+            # Nodes would crawl from their own high-water marks, so request different pages.
+            raise ValueError("Incremental crawl state is kept per node, it can't be used with CRAWL_JOB.")
+        if spider.incremental:
+            state_settings = crawler.settings.getdict("CRAWL_STATE_SETTINGS")
+            spider.crawl_state = CrawlState(Path(state_settings.get("DIR", ".crawl_state")) / f"{spider.name}.json")
+            spider.refresh_window = timedelta(days=float(state_settings.get("REFRESH_DAYS", 2)))
+            crawler.signals.connect(spider.crawl_closed, signal=signals.spider_closed)
+            # After spider_closed, so the Postgres pipeline has stored every article.
+            crawler.signals.connect(spider.save_crawl_state, signal=signals.engine_stopped)
+        return spider
+
+    async def seed_seen_articles(self, spider):
+        """
+        Mark articles scored within seed_window as seen, so they aren't counted and scored again.
+        """
+        postgres = Postgres.from_settings(self.settings.getdict("POSTGRES_PIPELINE_SETTINGS"))
+        since = self.to_datetime - self.seed_window
+        seeded = 0
+        try:
+            async with postgres.engine.connect() as db:
+                async for identifier in crawler_db_mapping[self.name].stream_identifiers_scored_since(db, since):
+                    seeded += self.seen_articles.add(identifier)
+        except DBAPIError as error:
+            # No table yet on a first crawl.
+            self.logger.warning("Couldn't seed seen articles from database: %s", error)
+        finally:
+            await postgres.close_db()
+        self.crawler.stats.set_value("dedup/seeded", seeded)
+        self.logger.info("Seeded %d articles scored since %s as seen", seeded, since)
+
+    def drop_seen(self, articles: list) -> list:
+        """
+        Articles not seen earlier in this crawl, e.g. on another category's page.
+        """
+        if self.seen_articles is None:
+            return articles
+        new = [article for article in articles if self.seen_articles.add(article.identifier or article.url)]
+        if len(new) < len(articles):
+            self.crawler.stats.inc_value("dedup/dropped", len(articles) - len(new))
+        return new
+
+    async def drop_seen_by_job(self, articles: list) -> list:
+        """
+        Articles no other node of a distributed crawl took, e.g. from another category's page.
+        """
+        if not articles:
+            return articles
+        new = await self.crawler.engine.slot.scheduler.add_seen(
+            [article.identifier or article.url for article in articles]
+        )
+        kept = [article for article in articles if (article.identifier or article.url) in new]
+        if len(kept) < len(articles):
+            self.crawler.stats.inc_value("dedup/dropped_by_job", len(articles) - len(kept))
+        return kept
+
+    def pin_window(self, to_datetime):
+        """
+        Crawl the same number of days up to to_datetime instead, e.g. the end a distributed job shares.
+        """
+        self.from_datetime = to_datetime - (self.to_datetime - self.from_datetime)
+        self.to_datetime = to_datetime
+
+    def crawl_from(self, key):
+        """
+        Start of crawl window for a high-water mark key. from_datetime when not incremental.
+        """
+        if self.crawl_state is None:
+            return self.from_datetime
+        return self.crawl_state.crawl_from(key, self.from_datetime, self.refresh_window)
+
+    def update_high_water(self):
+        """
+        Move high-water marks after a finished crawl. Override per spider.
+        """
+
+    def crawl_closed(self, spider, reason):
+        self.close_reason = reason
+
+    def save_crawl_state(self):
+        # An interrupted crawl didn't reach everything it marked, so don't checkpoint it.
+        if self.close_reason != "finished":
+            self.logger.warning("Crawl state not saved, spider closed with reason: %s", self.close_reason)
+            return
+        self.update_high_water()
+        self.crawl_state.save(keep_since=self.from_datetime)
+
+    async def parse_start_url(self, response, **kwargs):
         """
         Get list of article links from search result.
 
@@ -47,29 +195,146 @@ class BaseCrawler(CrawlSpider, metaclass=ABCMeta):
             response: Scrapy response
         """
         # Get all article on page.
-        articles = self.get_article_list(response)
+        articles = await self.extract_article_list(response)
+        # Before counting comments, so duplicates never reach the scorer.
+        wanted = self.drop_seen(self.filter_articles(response, articles))
+        if self.distributed and self.seen_articles is not None:
+            wanted = await self.drop_seen_by_job(wanted)
 
         # Query for comment count and populate Article object with it.
-        yield Request(
+        if self.count_batcher is not None:
+            for request in self.count_batcher.add(wanted):
+                yield request
+        elif wanted:
+            yield self.comment_count_request(wanted)
+        for request in self.next_requests(response, articles):
+            yield request
+
+    def comment_count_request(self, articles: list) -> Request:
+        return Request(
             self.comment_counter.make_comment_count_url(articles),
             method="GET",
             callback=self.populate_comment_count,
             cb_kwargs={"articles": articles}
         )
+
+    def crawl_comment_counts(self, requests):
+        for request in requests:
+            self.crawler.engine.crawl(request)
+
+    def start_count_flusher(self, spider):
+        self._count_flusher = asyncio.ensure_future(self.count_flush_loop())
+
+    async def stop_count_flusher(self, spider):
+        self._count_flusher.cancel()
+        await asyncio.gather(self._count_flusher, return_exceptions=True)
+
+    async def count_flush_loop(self):
+        """
+        Send a partial comment count batch once its oldest article waited max_wait.
+        """
+        while True:
+            await asyncio.sleep(self.count_batcher.max_wait / 2)
+            if self.count_batcher.is_due():
+                self.crawl_comment_counts(self.count_batcher.flush())
+
+    def flush_comment_counts_on_idle(self, spider):
+        # Nothing left to fill the batch with.
+        if self.count_batcher.pending:
+            self.crawl_comment_counts(self.count_batcher.flush())
+            raise DontCloseSpider
+
+    def filter_articles(self, response, articles: list) -> list:
+        """
+        Articles of a listing page to count comments of and store. Override per spider.
+        """
         return articles
 
-    def populate_comment_count(self, response, articles: list):
+    def next_requests(self, response, articles: list):
+        """
+        Requests to follow from a listing page besides its comment counts, given all its
+        articles. Override per spider.
+        """
+        return []
+
+    async def populate_comment_count(self, response, articles: list):
         """
         Add comment count data to article and yield.
 
         Args:
             articles: list of Article objects.
         """
-        comment_count_dict = self.comment_counter.parse_comment_count_response(response)
+        comment_count_dict = await self.offloader.run(
+            self.comment_counter.parse_comment_count_text, response.text, size=len(response.body)
+        )
         for article in articles:
+            if article.identifier not in comment_count_dict:
+                # Still store the article, but don't let a missing count zero its score or stored count.
+                self.logger.warning("No comment count for article %s. Marked for rescoring.", article.identifier)
+                article.comment_count = None
+                article.needs_rescore = True
+                yield article
+                continue
             article.comment_count = comment_count_dict[article.identifier]
+            if self.crawl_state is not None and not self.crawl_state.comment_count_changed(
+                article.identifier, article.comment_count
+            ):
+                # Already stored and scored with this comment count by an earlier run.
+                self.crawl_state.touch(article.identifier, self.to_datetime)
+                self.logger.debug("Article %s comment count unchanged. Skipped.", article.identifier)
+                self.crawler.stats.inc_value("incremental/unchanged_skipped")
+                continue
             yield article
 
-    @abstractmethod
+    def articles_stored(self, articles: list[dict]):
+        """
+        Called by the Postgres pipeline once articles are written. Their comment counts are
+        recorded for incremental crawls, unless they still need scoring.
+        """
+        if self.crawl_state is None:
+            return
+        for article in articles:
+            if not article["needs_rescore"]:
+                self.crawl_state.record_comment_count(
+                    article["identifier"], article["comment_count"], self.to_datetime
+                )
+
     def get_article_list(self, response):
-        return []
\ No newline at end of file
+        """
+        Get list of articles from response.
+
+        Return:
+            list of Article objects.
+        """
+        if not self.fast_extraction:
+            return self.get_article_list_css(response)
+        page, blocks = self.listing_parser_for(response).parse(response)
+        return self.build_articles(response, page, blocks)
+
+    async def extract_article_list(self, response):
+        """
+        get_article_list, parsing large pages in the offloader's pool.
+        """
+        if not self.fast_extraction or not self.offloader.offloads(len(response.body)):
+            return self.get_article_list(response)
+        parser = self.listing_parser_for(response)
+        page, blocks = await self.offloader.submit(parser.parse_text, response.text)
+        return self.build_articles(response, page, blocks)
+
+    @abstractmethod
+    def listing_parser_for(self, response) -> ListingParser:
+        """ListingParser of a listing page."""
+
+    @abstractmethod
+    def build_articles(self, response, page: dict, blocks: list[dict]) -> list:
+        """
+        Make Article objects from ListingParser output.
+        """
+        return []
+
+    @abstractmethod
+    def get_article_list_css(self, response):
+        """
+        get_article_list with Scrapy CSS selectors.
+        """
+        return []
@@ -7,12 +7,34 @@ from scrapy import Request
 from .crawler import BaseCrawler
 from news_crawler.items import TuoiTreArticle
 from news_crawler.helper.comment_counter import TuoiTreCounter
+from news_crawler.helper.listing_parser import ListingParser
 from news_crawler.pipelines import TuoiTreScorer, PostgresPipeline
 
 class TuoiTreSpider(BaseCrawler):
     name = "tuoitre"
     allowed_domains = ["tuoitre.vn"]
     comment_counter = TuoiTreCounter()
+    # Article and video timelines differ in how published time is shown.
+    listing_parsers = {
+        item_type: ListingParser(
+            block=".box-category-item",
+            fields={
+                "url": ".box-category-link-title::attr(href)",
+                "title": ".box-category-link-title::attr(title)",
+                "identifier": ".box-category-link-title::attr(data-id)",
+                "category": ".box-category-category::text",
+                "published_time": published_time_selector
+            }
+        )
+        for item_type, published_time_selector in (
+            ("article", ".time-ago-last-news::attr(title)"),
+            ("video", "span.time::text")
+        )
+    }
+    published_time_formats = {
+        "article": "%Y-%m-%dT%H:%M:%S%z",
+        "video": "%d/%m/%Y%z"
+    }
 
     custom_settings = {
         'ITEM_PIPELINES': {
@@ -21,66 +43,123 @@ class TuoiTreSpider(BaseCrawler):
         }
     }
 
-    def __init__(self, *args, days_ago: int = 30, **kwargs):
-        super().__init__(*args, days_ago=days_ago, **kwargs)
-        self.article_index = 1
-        self.video_index = 1
+    # Timeline page URLs by item type. Page number is carried in request meta, not spider
+    # state, so any node of a distributed crawl can follow any page.
+    timeline_urls = {
+        "article": "https://tuoitre.vn/timeline/0/trang-{page}.htm",
+        "video": "https://tuoitre.vn/timeline/search.htm?pageindex={page}"
+    }
 
-    @property
-    def article_url(self):
-        return f"https://tuoitre.vn/timeline/0/trang-{self.article_index}.htm"
+    def __init__(self, *args, days_ago: int = 30, prefetch_pages=1, **kwargs):
+        """
+        Args:
+            prefetch_pages: Timeline pages kept in flight ahead of the newest page parsed.
+                1 to fetch one page after another.
+        """
+        super().__init__(*args, days_ago=days_ago, **kwargs)
+        self.prefetch_pages = max(int(prefetch_pages), 1)
+        # Highest page requested per timeline. Per node in a distributed crawl, where the frontier
+        # drops pages another node requested already.
+        self.requested_page = {}
+        # First page per timeline reaching past the crawl window. Pages after it are ignored.
+        # Other nodes may still fetch a few of them, which filter_articles drops by published time.
+        self.cutoff_page = {}
+        # Newest published time seen per timeline, checkpointed when incremental.
+        self.newest_published = {}
 
-    @property
-    def video_url(self):
-        return f"https://tuoitre.vn/timeline/search.htm?pageindex={self.video_index}"
+    def timeline_request(self, item_type, page, **kwargs):
+        return Request(url=self.timeline_urls[item_type].format(page=page), meta={"page": page}, **kwargs)
 
     def start_requests(self):
-        yield Request(url=self.article_url)
-        yield Request(url=self.video_url)
+        for item_type in self.timeline_urls:
+            for page in range(1, self.prefetch_pages + 1):
+                yield self.timeline_request(item_type, page)
+            self.requested_page[item_type] = self.prefetch_pages
+
+    def filter_articles(self, response, articles):
+        """
+        Drop prefetched pages found to be past the crawl window.
+        """
+        if self.prefetch_pages == 1 or not articles:
+            return articles
+        item_type = articles[0].item_type
+        cutoff = self.cutoff_page.get(item_type)
+        # Timelines are newest first. Either way, nothing on the page is in the window.
+        if (cutoff is not None and response.meta["page"] > cutoff
+                or articles[0].published_time <= self.crawl_from(item_type)):
+            self.crawler.stats.inc_value("tuoitre/pages_past_cutoff")
+            return []
+        return articles
 
-    def parse_start_url(self, response, **kwargs):
+    def next_requests(self, response, articles):
         """
-        Override super's parse_start_url to also decide if go onto next page.
+        Decide if go onto next page.
         Decide by comparing the last article's published time and compare it with our date range.
+        Keep prefetch_pages pages requested past the newest page parsed until the cutoff is found.
         """
-        articles = yield from super().parse_start_url(response, **kwargs)
+        page = response.meta.get("page", 1)
+        if not articles:
+            self.logger.warning("No articles on %s", response.url)
+            return
+        for article in articles:
+            newest = self.newest_published.get(article.item_type)
+            if newest is None or article.published_time > newest:
+                self.newest_published[article.item_type] = article.published_time
         last_article = articles[-1]
-        next_page_url = self.next_page_decider(last_article)
-        if next_page_url:
-            yield Request(url=next_page_url, callback=self.parse_start_url)
-        else:
-            self.logger.debug(
-                "Stopped going to next page for %s. Article index: %s. Video index: %s",
-                last_article.item_type, self.article_index, self.video_index
-            )
+        item_type = last_article.item_type
+        if not self.next_page_decider(last_article):
+            self.cutoff_page[item_type] = min(page, self.cutoff_page.get(item_type, page))
+            self.logger.debug("Stopped going to next page for %s at page %s", item_type, page)
+            return
+        if item_type in self.cutoff_page:
+            # A later page already reached the end of the window.
+            return
+        # Pages may be parsed out of order, and by other nodes in a distributed crawl.
+        requested = max(self.requested_page.get(item_type, page), page)
+        for next_page in range(requested + 1, page + self.prefetch_pages + 1):
+            yield self.timeline_request(item_type, next_page, callback=self.parse_start_url)
+        self.requested_page[item_type] = max(requested, page + self.prefetch_pages)
 
     def next_page_decider(self, article):
         """
         Decide if continue to next page by checking article time against self.from_datetime.
-        Return next page url.
         """
         published_time = article.published_time
-        item_type = article.item_type
+        from_datetime = self.crawl_from(article.item_type)
         self.logger.debug(
             "Comparing published time %s vs query time %s",
             published_time.strftime("%b %d %H:%M:%S"),
-            self.from_datetime.strftime("%b %d %H:%M:%S")
+            from_datetime.strftime("%b %d %H:%M:%S")
         )
-        if published_time > self.from_datetime:
-            if item_type == "video":
-                self.video_index += 1
-                url = self.video_url
-            else:
-                self.article_index += 1
-                url = self.article_url
-            return url
-
-    def get_article_list(self, response):
+        return published_time > from_datetime
+
+    def update_high_water(self):
         """
-        Get list of articles from response.
+        Timelines are newest first, so a finished crawl covered everything up to the newest article seen.
+        """
+        for item_type, published_time in self.newest_published.items():
+            self.crawl_state.set_high_water(item_type, published_time)
+
+    @staticmethod
+    def item_type_of(response):
+        return "article" if response.url.endswith(".htm") else "video"
 
-        Return:
-            list of Article objects.
+    def listing_parser_for(self, response):
+        return self.listing_parsers[self.item_type_of(response)]
+
+    def build_articles(self, response, page, blocks):
+        item_type = self.item_type_of(response)
+        published_time_format = self.published_time_formats[item_type]
+        articles = []
+        for block in blocks:
+            # Convert published time from string GMT+7 to UTC timestamp
+            block["published_time"] = datetime.strptime(block["published_time"] + "+0700", published_time_format)
+            articles.append(TuoiTreArticle(**block, item_type=item_type))
+        return articles
+
+    def get_article_list_css(self, response):
+        """
+        get_article_list with Scrapy CSS selectors.
         """
         article_block_selector = ".box-category-item"
         articles = []
@@ -1,13 +1,17 @@
 """
 VnExpress crawler.
 """
-from scrapy import FormRequest
+from datetime import timedelta
+
+from scrapy import FormRequest, Request, signals
 from scrapy.spiders import Rule
 from scrapy.linkextractors import LinkExtractor
 
 from .crawler import BaseCrawler
 from news_crawler.items import VnExpressArticle
+from news_crawler.helper.category_index import CategoryIndex
 from news_crawler.helper.comment_counter import VnExpressCounter
+from news_crawler.helper.listing_parser import ListingParser
 from news_crawler.pipelines import VnExpressScorer, PostgresPipeline
 
 
@@ -15,6 +19,16 @@ class VnExpressSpider(BaseCrawler):
     name = "vnexpress"
     allowed_domains = ["vnexpress.net"]
     comment_counter = VnExpressCounter()
+    listing_parser = ListingParser(
+        block="article.item-news-common",
+        fields={
+            "url": "h3 a::attr(href)",
+            "title": "h3 a::text",
+            "article_id": "span.txt_num_comment::attr(data-objectid)",
+            "article_type": "span.txt_num_comment::attr(data-objecttype)"
+        },
+        page_fields={"category_id": "nav.main-nav li.active::attr(data-id)"}
+    )
 
     custom_settings = {
         'ITEM_PIPELINES': {
@@ -31,51 +45,166 @@ class VnExpressSpider(BaseCrawler):
         ),
     )
 
-    def __init__(self, *args, days_ago: int = 30, **kwargs):
+    # Categories crawled when discovery is disabled or fails.
+    fallback_categories = {
+        1001005: "thoi-su",
+        1003450: "goc-nhin",
+        1001002: "the-gioi",
+        1003159: "kinh-doanh",
+        1005628: "bat-dong-san",
+        1002691: "giai-tri",
+        1002565: "the-thao",
+        1001007: "phap-luat",
+        1003497: "giao-duc",
+        1003750: "suc-khoe",
+        1002966: "doi-song",
+        1003231: "du-lich",
+        1001009: "khoa-hoc",
+        1002592: "so-hoa",
+        1001006: "xe",
+        1001012: "y-kien",
+        1001014: "tam-su",
+        1001011: "cuoi",
+        # 1004565: "tuyen-dau-chong-dich"       # empty category
+    }
+    home_url = "https://vnexpress.net/"
+
+    def __init__(self, *args, days_ago: int = 30, shard_days=0, **kwargs):
+        """
+        Args:
+            shard_days: Split each category's date range into ranges of this many days,
+                crawled as parallel pagination chains. 0 for one range per category.
+        """
         super().__init__(*args, days_ago=days_ago, **kwargs)
         self.by_day_api = "https://vnexpress.net/category/day"
+        self.shard = timedelta(days=float(shard_days)) if float(shard_days) > 0 else None
+        # Loaded in from_crawler when CATEGORY_INDEX_SETTINGS PATH is set.
+        self.category_index = None
+        self.crawled_categories = []
+        # Categories this node crawled over the whole days_ago window, which alone can tell they're empty.
+        self.full_window_categories = set()
+        # Articles on the first pages of each category.
+        self.category_articles = {}
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        index_settings = crawler.settings.getdict("CATEGORY_INDEX_SETTINGS")
+        if index_settings.get("PATH"):
+            spider.category_index = CategoryIndex(
+                index_settings["PATH"],
+                timedelta(hours=float(index_settings.get("TTL_HOURS", 24))),
+                timedelta(days=float(index_settings.get("EMPTY_SKIP_DAYS", 7)))
+            )
+            crawler.signals.connect(spider.save_category_index, signal=signals.spider_closed)
+        return spider
 
     def start_requests(self):
         """
         VnExpress allows to search articles by date range and categories, which
         we will exploit our crawl.
+        Categories come from the site's navigation bar, discovered again once the cached
+        index expires.
         """
-        # Manually added categories ID.
-        categories = {
-            1001005: "thoi-su",
-            1003450: "goc-nhin",
-            1001002: "the-gioi",
-            1003159: "kinh-doanh",
-            1005628: "bat-dong-san",
-            1002691: "giai-tri",
-            1002565: "the-thao",
-            1001007: "phap-luat",
-            1003497: "giao-duc",
-            1003750: "suc-khoe",
-            1002966: "doi-song",
-            1003231: "du-lich",
-            1001009: "khoa-hoc",
-            1002592: "so-hoa",
-            1001006: "xe",
-            1001012: "y-kien",
-            1001014: "tam-su",
-            1001011: "cuoi",
-            # 1004565: "tuyen-dau-chong-dich"       # empty category
-        }
+        if self.category_index is None:
+            yield from self.category_requests(self.fallback_categories)
+        elif self.category_index.is_fresh(self.to_datetime):
+            yield from self.category_requests(self.category_index.categories)
+        else:
+            yield Request(self.home_url, callback=self.parse_categories, errback=self.discovery_failed)
+
+    def parse_categories(self, response):
+        """
+        Discover categories from the navigation bar and crawl them.
+        """
+        categories = {}
+        for category in response.css("nav.main-nav li[data-id]"):
+            cat_id = category.attrib["data-id"]
+            if not cat_id.isdigit():
+                continue
+            href = category.css("a::attr(href)").get() or ""
+            categories[int(cat_id)] = href.strip("/").split("/")[-1]
+        if not categories:
+            self.logger.warning("No category found on %s. Using fallback categories.", response.url)
+            yield from self.category_requests(self.fallback_categories)
+            return
+        self.logger.info("Discovered %d categories", len(categories))
+        self.category_index.set_categories(categories, self.to_datetime)
+        self.category_index.save()
+        yield from self.category_requests(categories)
+
+    def discovery_failed(self, failure):
+        self.logger.warning("Category discovery failed: %r. Using fallback categories.", failure.value)
+        yield from self.category_requests(self.fallback_categories)
+
+    def category_requests(self, categories: dict):
+        """
+        First listing page of each category and date range, skipping recently empty categories.
+        """
+        if self.category_index is not None:
+            categories = self.category_index.crawlable(categories, self.to_datetime)
+        self.crawled_categories = list(categories)
         for cat_id in categories:
-            params = {
-                "cateid": str(cat_id),
-                "fromdate": f"{self.from_datetime.timestamp():0.0f}",
-                "todate": f"{self.to_datetime.timestamp():0.0f}"
-            }
-            yield FormRequest(self.by_day_api, method="GET", formdata=params)
-
-    def get_article_list(self, response):
+            crawl_from = self.crawl_from(f"cateid:{cat_id}")
+            # Incremental crawls only go back to the last one, where a live category may have
+            # nothing new. Distributed ones leave some of its date ranges to other nodes.
+            if crawl_from <= self.from_datetime and not self.distributed:
+                self.full_window_categories.add(cat_id)
+            for from_datetime, to_datetime in self.date_ranges(crawl_from):
+                params = {
+                    "cateid": str(cat_id),
+                    "fromdate": f"{from_datetime.timestamp():0.0f}",
+                    "todate": f"{to_datetime.timestamp():0.0f}"
+                }
+                yield FormRequest(self.by_day_api, method="GET", formdata=params, meta={"category_id": cat_id})
+
+    def next_requests(self, response, articles):
+        # Followed pages don't carry category_id: a category is empty if its first pages are.
+        cat_id = response.meta.get("category_id")
+        if cat_id is not None:
+            self.category_articles[cat_id] = self.category_articles.get(cat_id, 0) + len(articles)
+        return []
+
+    def save_category_index(self, spider, reason):
+        # An interrupted crawl may not have reached every category.
+        if reason != "finished":
+            return
+        for cat_id, count in self.category_articles.items():
+            # Articles found in any window show a category is live.
+            if count or cat_id in self.full_window_categories:
+                self.category_index.record_article_count(cat_id, count, self.to_datetime)
+        self.category_index.save()
+
+    def date_ranges(self, from_datetime):
+        """
+        Yield (from, to) ranges covering from_datetime to to_datetime, newest first.
+        Each range is paginated on its own, so shards are followed in parallel.
         """
-        Get list of articles from response.
+        if self.shard is None:
+            yield from_datetime, self.to_datetime
+            return
+        to_datetime = self.to_datetime
+        while to_datetime > from_datetime:
+            shard_from = max(to_datetime - self.shard, from_datetime)
+            yield shard_from, to_datetime
+            to_datetime = shard_from
 
-        Return:
-            list of Article objects.
+    def update_high_water(self):
+        """
+        Every category was crawled up to to_datetime.
+        """
+        for cat_id in self.crawled_categories:
+            self.crawl_state.set_high_water(f"cateid:{cat_id}", self.to_datetime)
+
+    def listing_parser_for(self, response):
+        return self.listing_parser
+
+    def build_articles(self, response, page, blocks):
+        return [VnExpressArticle(**block, category_id=page["category_id"]) for block in blocks]
+
+    def get_article_list_css(self, response):
+        """
+        get_article_list with Scrapy CSS selectors.
         """
         article_block_selector = "article.item-news-common"
         category_id_selector = "nav.main-nav li.active::attr(data-id)"
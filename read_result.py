@@ -1,63 +1,198 @@
 import asyncio
-from os import environ
+import csv
+import json
+import sys
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 from argparse import ArgumentParser
+from scrapy.utils.project import get_project_settings
 
 from database.services.article_service import crawler_db_mapping
+from database.services.postgres_service import RANKING_WINDOWS
 from database.postgres import Postgres
 
 
 load_dotenv()
 
+# Columns exported, in order.
+COLUMNS = ("score", "url", "title", "comment_count", "published_time")
+
 def init_postgres():
     """
-    Initiate a postgres instance from settings in .env
+    Initiate a postgres instance from settings in .env, with the same pool settings as the crawler.
     Return a Postgres instance
     """
-    pguri = "postgresql+asyncpg://{}:{}@{}:{}/{}".format(
-        environ.get("POSTGRES_USER", "postgres"),
-        environ.get("POSTGRES_PASSWORD", "postgres"),
-        environ.get("POSTGRES_HOST", "localhost"),
-        environ.get("POSTGRES_PORT", 5432),
-        environ.get("POSTGRES_DB", "postgres")
-    )
-    postgres = Postgres(uri=pguri)
-    return postgres
+    pg_settings = get_project_settings().getdict("POSTGRES_PIPELINE_SETTINGS")
+    return Postgres.from_settings(pg_settings)
 
 async def close_postgres(postgres: Postgres):
     """Close the Postgres instance."""
     await postgres.close_db()
 
-async def get_ranked_result(postgres: Postgres, DBService, output=None):
+
+class TextWriter:
+    """Score and URL per line."""
+    columns = ("score", "url")
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, rows):
+        self.file.writelines(f"{row['score']:7d} {row['url']}\n" for row in rows)
+
+    def close(self):
+        pass
+
+class CsvWriter:
+    columns = COLUMNS
+
+    def __init__(self, file):
+        self.writer = csv.DictWriter(file, self.columns)
+        self.writer.writeheader()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+
+    def close(self):
+        pass
+
+class JsonlWriter:
+    columns = COLUMNS
+
+    def __init__(self, file):
+        self.file = file
+
+    def write(self, rows):
+        self.file.writelines(json.dumps(row, ensure_ascii=False, default=str) + "\n" for row in rows)
+
+    def close(self):
+        pass
+
+class ParquetWriter:
+    """Each page becomes one row group. Needs pyarrow."""
+    columns = COLUMNS
+
+    def __init__(self, path):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([
+            ("score", pyarrow.int32()),
+            ("url", pyarrow.string()),
+            ("title", pyarrow.string()),
+            ("comment_count", pyarrow.int32()),
+            ("published_time", pyarrow.timestamp("us", tz="UTC")),
+        ])
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema)
+
+    def write(self, rows):
+        self.writer.write_table(self.pyarrow.Table.from_pylist(rows, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+writers = {
+    "text": TextWriter,
+    "csv": CsvWriter,
+    "jsonl": JsonlWriter,
+    "parquet": ParquetWriter
+}
+
+async def get_ranked_result(
+    postgres: Postgres, DBService, output=None, output_format="text", limit=None, since=None, page_size=1000
+):
     """
-    Save output to a file. If not specified print to stdout instead.
+    Stream articles by score to a file page by page. If not specified print to stdout instead.
 
     Args:
         postgres: The Postgres instance
         DBService: One of Service type class
         output: path to output file.
+        output_format: One of writers.
+        limit: Only write the top N articles.
+        since: Only write articles published since this datetime.
+        page_size: Rows read and written at a time.
+    """
+    Writer = writers[output_format]
+    if output_format == "parquet":
+        if not output:
+            raise SystemExit("Parquet output needs a file (-o).")
+        file = None
+        writer = Writer(output)
+    else:
+        file = open(output, "w", newline="") if output else sys.stdout
+        writer = Writer(file)
+    count = 0
+    try:
+        async with postgres.engine.connect() as db_conn:
+            page = []
+            rows = DBService.stream_article_ranked(
+                db_conn, Writer.columns, since=since, limit=limit, page_size=page_size
+            )
+            async for row in rows:
+                page.append(row)
+                if len(page) >= page_size:
+                    writer.write(page)
+                    count += len(page)
+                    page = []
+            if page or count == 0:
+                writer.write(page)
+                count += len(page)
+        writer.close()
+    finally:
+        if file is not None and file is not sys.stdout:
+            file.close()
+    print(f"Wrote {count} articles to {output or 'stdout'}", file=sys.stderr)
+
+async def get_windowed_top(postgres: Postgres, DBService, window, limit=10, category=None, output=None):
+    """
+    Write top articles per category published in a ranking window, from the ranking views.
     """
     async with postgres.engine.connect() as db_conn:
-        result = await DBService.get_all_article_ranked(db_conn)
-    result_map = map(lambda a: f"{a.score:7d} {a.url}\n", result)
+        result = await DBService.get_top(db_conn, window, limit, category)
+    lines = (f"{a.category:>12} {a.rank:3d} {a.score:7d} {a.url}\n" for a in result)
     if output:
         with open(output, 'w') as f:
-            f.writelines(f"Wrote {len(result)} output to {output}\n")
-            f.writelines(result_map)
+            f.writelines(lines)
     else:
-        print(f"Logging {len(result)} output to stdout...")
-        for line in result_map:
+        for line in lines:
             print(line, end="")
+    print(f"Wrote {len(result)} articles to {output or 'stdout'}", file=sys.stderr)
+
+def parse_since(value):
+    """ISO date or datetime, UTC unless it has a timezone."""
+    since = datetime.fromisoformat(value)
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    return since
 
 async def main():
     parser = ArgumentParser(prog="read_result", description="Read result from Postgres Database.")
     parser.add_argument("SITENAME", help="Select database to read from (vnexpress|tuoitre)")
     parser.add_argument("-o", "--output", help="File to save result to. If not set default to stdout.", required=False, default=None)
+    parser.add_argument("-f", "--format", choices=writers.keys(), help="Output format. Default to output file extension, else text.")
+    parser.add_argument("-n", "--top", "--limit", dest="limit", type=int, help="Only output the N highest scored articles.")
+    parser.add_argument("--since", type=parse_since, help="Only output articles published since this ISO date (UTC).")
+    parser.add_argument("-w", "--window", choices=RANKING_WINDOWS.keys(), help="Top --top (default 10) articles per category published in this window.")
+    parser.add_argument("-c", "--category", help="With --window, only this category.")
+    parser.add_argument("--page-size", type=int, default=1000, help="Rows read from the database at a time.")
     args = parser.parse_args()
+    output_format = args.format
+    if output_format is None:
+        extension = args.output.rsplit(".", 1)[-1] if args.output and "." in args.output else ""
+        output_format = extension if extension in writers else "text"
     DBService = crawler_db_mapping[args.SITENAME]
     pg_conn = init_postgres()
-    await get_ranked_result(pg_conn, DBService, args.output)
-    await close_postgres(pg_conn)
+    try:
+        if args.window:
+            await get_windowed_top(pg_conn, DBService, args.window, args.limit or 10, args.category, args.output)
+            return
+        await get_ranked_result(pg_conn, DBService, args.output, output_format, args.limit, args.since, args.page_size)
+    finally:
+        await close_postgres(pg_conn)
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,68 @@
+"""
+BasePostgresService upserts, against SQLite (needs aiosqlite).
+"""
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from sqlalchemy import select, update
+
+from database.postgres import Postgres
+from database.schema.base import Base
+from database.schema.history import score_history
+from database.services.article_service import VnExpressDBService
+
+
+def article(score_time, score=10, comment_count=3):
+    return {
+        "url": "https://vnexpress.net/a-1.html",
+        "title": "A",
+        "article_id": "1",
+        "article_type": 1,
+        "category_id": "1001005",
+        "identifier": "1",
+        "score": score,
+        "comment_count": comment_count,
+        "score_time": score_time,
+        "needs_rescore": False,
+    }
+
+
+async def upsert_twice(uri, method, first, second):
+    postgres = Postgres(uri=uri)
+    await postgres.init_db(Base.metadata)
+    try:
+        async with postgres.engine.connect() as db:
+            await VnExpressDBService.bulk_upsert(db, [first], method)
+            # Stored by an earlier crawl. SQLite's CURRENT_TIMESTAMP only has second resolution.
+            await db.execute(update(VnExpressDBService.model).values(update_time=first["score_time"]))
+            await VnExpressDBService.bulk_upsert(db, [second], method)
+            row = (await db.execute(select(VnExpressDBService.model.score_time, VnExpressDBService.model.score))).one()
+            history = (await db.execute(select(score_history.c.score))).scalars().all()
+            await db.commit()
+    finally:
+        await postgres.close_db()
+    return row, history
+
+
+@pytest.mark.parametrize("method", ["values", "executemany"])
+def test_unchanged_score_advances_score_time(tmp_path, method):
+    scored = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rescored = scored + timedelta(hours=1)
+    (score_time, score), history = asyncio.run(upsert_twice(
+        f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}", method, article(scored), article(rescored)
+    ))
+    assert score == 10
+    assert score_time.replace(tzinfo=timezone.utc) == rescored
+    # Only the insert changed content.
+    assert history == [10]
+
+
+def test_changed_score_is_recorded(tmp_path):
+    scored = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    (_, score), history = asyncio.run(upsert_twice(
+        f"sqlite+aiosqlite:///{tmp_path / 'db.sqlite'}", "values",
+        article(scored), article(scored + timedelta(hours=1), score=12, comment_count=4)
+    ))
+    assert score == 12
+    assert sorted(history) == [10, 12]
@@ -0,0 +1,54 @@
+"""
+Frontier request serialization of DistributedScheduler.
+"""
+import json
+import pickle
+from datetime import datetime, timezone
+
+import pytest
+from scrapy import Request, Spider
+from scrapy.http import JsonRequest
+
+from news_crawler.items import TuoiTreArticle
+from news_crawler.scheduler import dump_request, load_request
+
+
+class CallbackSpider(Spider):
+    name = "callback"
+
+    def parse_article(self, response):
+        pass
+
+
+def test_request_round_trip():
+    spider = CallbackSpider()
+    article = TuoiTreArticle(
+        url="/a-1.htm", title="A", comment_count=3, score=10, identifier="1", needs_rescore=False,
+        published_time=datetime(2025, 1, 1, tzinfo=timezone.utc), category="1", item_type=0
+    )
+    request = JsonRequest(
+        "https://tuoitre.vn/a-1.htm", data={"id": 1}, callback=spider.parse_article, priority=3,
+        meta={"article": article, "ids": {1: "a"}}
+    )
+    loaded = load_request(dump_request(request, spider), spider)
+    assert type(loaded) is JsonRequest
+    assert loaded.body == request.body
+    assert loaded.callback == spider.parse_article
+    assert loaded.priority == 3
+    assert loaded.meta["ids"] == {1: "a"}
+    # Not prefixed a second time.
+    assert loaded.meta["article"] == article
+
+
+def test_pickles_are_not_loaded():
+    spider = CallbackSpider()
+    with pytest.raises(ValueError):
+        load_request(pickle.dumps(Request("https://vnexpress.net").to_dict(spider=spider)), spider)
+
+
+def test_unknown_request_class_is_refused():
+    spider = CallbackSpider()
+    data = json.loads(dump_request(Request("https://vnexpress.net"), spider))
+    data["_class"] = "os.system"
+    with pytest.raises(ValueError):
+        load_request(json.dumps(data).encode(), spider)
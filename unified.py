@@ -0,0 +1,76 @@
+import asyncio
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from argparse import ArgumentParser
+
+from database.schema.base import Base
+from database.services.article_service import crawler_db_mapping
+from scrapy.utils.project import get_project_settings
+
+from database.services.unified_service import UnifiedArticleService, add_months, month_start, retention_cutoff
+from read_result import init_postgres, close_postgres, parse_since
+
+
+load_dotenv()
+
+async def sync(postgres, sites, since=None, keep_months=0):
+    """Copy site tables into the unified article table, skipping months retention dropped."""
+    keep_since = retention_cutoff(keep_months)
+    async with postgres.engine.connect() as db_conn:
+        for site in sites:
+            await UnifiedArticleService.sync_from_site(db_conn, site, crawler_db_mapping[site], since, keep_since)
+
+async def create_partitions(postgres, months_ahead):
+    """Create partitions from this month up to months_ahead, so inserts never lack one."""
+    start = datetime.now(timezone.utc)
+    end = add_months(start, months_ahead)
+    async with postgres.engine.connect() as db_conn:
+        await UnifiedArticleService.ensure_partitions(db_conn, start, end)
+
+async def apply_retention(postgres, keep_months):
+    """
+    Drop partitions of months older than keep_months before this one, and delete articles
+    published before then from the site tables.
+    """
+    cutoff = retention_cutoff(keep_months)
+    async with postgres.engine.connect() as db_conn:
+        dropped = await UnifiedArticleService.drop_partitions_before(db_conn, cutoff)
+        for DBService in crawler_db_mapping.values():
+            deleted = await DBService.delete_published_before(db_conn, month_start(cutoff))
+            print(f"Deleted {deleted} {DBService.site} articles before {cutoff:%Y-%m}")
+    print(f"Dropped {len(dropped)} partitions before {cutoff:%Y-%m}")
+
+async def main():
+    parser = ArgumentParser(prog="unified", description="Maintain the cross-site article table.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    migrate = commands.add_parser("migrate", help="Create the table and copy every site table into it.")
+    migrate.add_argument("--site", choices=crawler_db_mapping.keys(), action="append", help="Only this site. Repeatable.")
+    sync_parser = commands.add_parser("sync", help="Copy rows updated since a date.")
+    sync_parser.add_argument("--site", choices=crawler_db_mapping.keys(), action="append", help="Only this site. Repeatable.")
+    sync_parser.add_argument("--since", type=parse_since, required=True, help="ISO date (UTC).")
+    partitions = commands.add_parser("partitions", help="Create partitions ahead of time.")
+    partitions.add_argument("--ahead", type=int, default=2, help="Months after this one.")
+    retention = commands.add_parser("retention", help="Drop old partitions.")
+    keep_months = int(get_project_settings().getdict("POSTGRES_PIPELINE_SETTINGS").get("RETENTION_MONTHS") or 0)
+    retention.add_argument(
+        "--keep-months", type=int, default=keep_months, required=not keep_months,
+        help="Months kept before this one. Default to RETENTION_MONTHS."
+    )
+    args = parser.parse_args()
+
+    pg_conn = init_postgres()
+    try:
+        if args.command == "migrate":
+            await pg_conn.init_db(Base.metadata)
+            await sync(pg_conn, args.site or crawler_db_mapping.keys(), keep_months=keep_months)
+        elif args.command == "sync":
+            await sync(pg_conn, args.site or crawler_db_mapping.keys(), args.since, keep_months)
+        elif args.command == "partitions":
+            await create_partitions(pg_conn, args.ahead)
+        elif args.command == "retention":
+            await apply_retention(pg_conn, args.keep_months)
+    finally:
+        await close_postgres(pg_conn)
+
+if __name__ == "__main__":
+    asyncio.run(main())